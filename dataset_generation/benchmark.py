@@ -0,0 +1,238 @@
+# Benchmark the extractors, for example:
+#   python benchmark.py original/django-master
+# compares the docstring extractors on a repository and
+#   python benchmark.py --suite --lines 20000
+# times the extractors, util.cleanCode and the converters on synthetic files
+# (see synthetic.py) and reports the lines/sec and peak memory of each
+
+import argparse
+import collections
+import getComments
+import getDocStrings
+import getDocStringsAst
+import json
+import os
+import resource
+import shutil
+import sources
+import subprocess
+import sys
+import synthetic
+import tempfile
+import time
+import util
+import verwerk
+
+
+# read all python files in the directory which are handed to a docstring extractor
+def loadSources(directory):
+    repository = sources.openSource(directory)
+
+    loaded = []
+    for (file, source) in repository.iterSources(verwerk.getFileList(repository)):
+        if verwerk.docstringMarker in source:
+            loaded.append((file, source))
+
+    return loaded
+
+
+# time a single extractor on every source, keeps the best of repeat runs per file
+def timeExtractor(extractor, sources, repeat):
+    times = []
+    counts = collections.Counter()
+
+    for (file, source) in sources:
+        best = None
+        for _ in xrange(repeat):
+            fileCounts = collections.Counter()
+            start = time.time()
+            for _ in extractor.iter_pairs(source, verwerk.maxBucket, file, fileCounts):
+                pass
+            elapsed = time.time() - start
+
+            if best is None or elapsed < best:
+                best = elapsed
+
+        counts.update(fileCounts)
+        times.append(best)
+
+    return (times, counts)
+
+
+# compare the line scanner and the ast extractor on the directory
+def benchmarkDocStrings(directory, repeat=3, slowest=5):
+    sources = loadSources(directory)
+    lines = sum(source.count("\n") for (_, source) in sources)
+    print "Benchmarking %d files with docstrings, %d lines\n" % (len(sources), lines)
+
+    results = collections.OrderedDict()
+    for (name, extractor) in sorted(verwerk.docstringExtractors.items()):
+        results[name] = timeExtractor(extractor, sources, repeat)
+
+    print "%-10s %10s %14s %10s %10s" % ("extractor", "seconds", "lines/sec", "normal", "rejected")
+    for (name, (times, counts)) in results.items():
+        total = sum(times)
+        print "%-10s %10.3f %14.0f %10d %10d" % (name, total, lines / max(total, 1e-9),
+                                              counts["normal docstrings"], counts["rejected docstrings"])
+
+    linesTotal = sum(results["lines"][0])
+    astTotal = sum(results["ast"][0])
+    print "\nSpeedup of ast over lines: %.2fx" % (linesTotal / max(astTotal, 1e-9))
+
+    # the files the line scanner spends the most time on
+    print "\nSlowest files for the line scanner:"
+    order = sorted(xrange(len(sources)), key=lambda i: results["lines"][0][i], reverse=True)
+    for i in order[:slowest]:
+        print "%8.3fs (ast %8.3fs) %s" % (results["lines"][0][i], results["ast"][0][i], sources[i][0])
+
+
+class NullWriter(object):
+    """ A pair writer which drops the pairs, so only the extraction is timed. """
+
+    def write(self, code, comment):
+        pass
+
+
+# write the raw files of the pairs of the source into the directory, the
+# input of the converters
+def writeRawFiles(source, directory):
+    verwerk.processedPath = os.path.join(directory, "raw") + "/"
+    verwerk.directories = ["synthetic"]
+    os.makedirs(verwerk.processedPath)
+
+    writers = verwerk.openWriters(verwerk.processedPath + "synthetic")
+    for pair in verwerk.extractFile("synthetic.py", source, collections.Counter()):
+        writers[pair.kind].writePair(pair)
+
+    for writer in writers.values():
+        writer.close()
+
+
+# convert the raw files into the readable format and the training files
+def runConverters(directory):
+    (enFile, codeFile, sourceFile, readable) = [os.path.join(directory, name) for name in
+                                                ["synthetic.en", "synthetic.code", "synthetic.src", "readable.txt"]]
+    for file in [enFile, codeFile, sourceFile, readable]:
+        open(file, 'w').close()
+
+    counter = verwerk.createReadableFormat(readable, "comment", 1)
+    verwerk.createReadableFormat(readable, "docstring", counter)
+    counter = verwerk.createTrainingFile(enFile, codeFile, sourceFile, "comment", 1, "synthetic")
+    verwerk.createTrainingFile(enFile, codeFile, sourceFile, "docstring", counter, "synthetic")
+
+
+# the benchmark targets, each gets the source and a scratch directory and
+# returns the function which is timed
+targets = collections.OrderedDict([
+    ("comments", lambda source, directory:
+        lambda: getComments.generate_pairs(source, NullWriter(), verwerk.maxBucket)),
+    ("docstrings", lambda source, directory:
+        lambda: getDocStrings.generate_pairs(source, NullWriter(), verwerk.maxBucket)),
+    ("docstrings ast", lambda source, directory:
+        lambda: getDocStringsAst.generate_pairs(source, NullWriter(), verwerk.maxBucket)),
+])
+
+
+def cleanCodeTarget(source, directory):
+    # cleanCode is called on the code of a single pair at a time
+    lines = [line.strip() for line in source.splitlines()]
+    chunks = [lines[start:start + 20] for start in xrange(0, len(lines), 20)]
+    return lambda: [util.cleanCode(list(chunk)) for chunk in chunks]
+
+
+def convertersTarget(source, directory):
+    writeRawFiles(source, directory)
+    return lambda: runConverters(directory)
+
+
+targets["cleanCode"] = cleanCodeTarget
+targets["converters"] = convertersTarget
+
+
+# the target of the baseline run, which only reads the file
+baselineTarget = "baseline"
+
+
+# run a single target on a file in this process and return its timing and the
+# peak memory, the maximum resident set size of the process in KB. The run
+# should be the only one in a fresh process, as the maximum resident set size
+# never goes down.
+def runTarget(target, file, repeat):
+    with open(file) as fp:
+        source = fp.read()
+
+    directory = tempfile.mkdtemp()
+    try:
+        job = lambda: None
+        if target != baselineTarget:
+            job = targets[target](source, directory)
+
+        best = None
+        for _ in xrange(repeat):
+            start = time.time()
+            job()
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    finally:
+        shutil.rmtree(directory)
+
+    return {"target": target, "lines": source.count("\n"), "seconds": best, "peakKB": peak}
+
+
+# run a target on a file in a new process and return its result
+def runProcess(target, file, repeat):
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                      "--run", target, file, "--repeat", str(repeat)])
+    return json.loads(output.splitlines()[-1])
+
+
+# run every target on every synthetic case, each run is a new process so the
+# peak memory of one run does not hide that of the next. The peak memory of a
+# run is reported above that of a baseline process which only reads the file.
+def benchmarkSuite(lines, repeat=3, caseNames=None, targetNames=None):
+    directory = tempfile.mkdtemp()
+    try:
+        print "%-16s %-16s %9s %10s %14s %10s" % ("case", "target", "lines", "seconds", "lines/sec", "peak MB")
+        for (case, generator) in synthetic.cases.items():
+            if caseNames and case not in caseNames:
+                continue
+
+            file = os.path.join(directory, case.replace(" ", "_") + ".py")
+            with open(file, 'w') as fp:
+                fp.write(generator(lines))
+
+            base = runProcess(baselineTarget, file, 1)["peakKB"]
+            for target in targets:
+                if targetNames and target not in targetNames:
+                    continue
+
+                result = runProcess(target, file, repeat)
+                print "%-16s %-16s %9d %10.3f %14.0f %10.1f" % (case, target, result["lines"], result["seconds"],
+                                                                result["lines"] / max(result["seconds"], 1e-9),
+                                                                (result["peakKB"] - base) / 1024.0)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the extractors on a repository or on synthetic files.")
+    parser.add_argument("directory", nargs="?", default=verwerk.originalPath + "django-master",
+                        help="directory with the python files (default %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per file, the fastest is kept")
+    parser.add_argument("--suite", action="store_true", help="run the benchmark suite on synthetic files")
+    parser.add_argument("--lines", type=int, default=20000, help="lines of every synthetic file (default %(default)s)")
+    parser.add_argument("--cases", nargs="+", choices=synthetic.cases.keys(), help="only run these synthetic cases")
+    parser.add_argument("--targets", nargs="+", choices=targets.keys(), help="only benchmark these targets")
+    parser.add_argument("--run", nargs=2, metavar=("TARGET", "FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        # a single run of the suite, in its own process
+        print json.dumps(runTarget(args.run[0], args.run[1], args.repeat))
+    elif args.suite:
+        benchmarkSuite(args.lines, args.repeat, args.cases, args.targets)
+    else:
+        benchmarkDocStrings(args.directory, args.repeat)
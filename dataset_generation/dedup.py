@@ -0,0 +1,108 @@
+# Removal of duplicate code-comment pairs. Exact duplicates are found by
+# hashing the normalised pair, near-duplicates by comparing MinHash signatures
+# of the token shingles of the pair, using an LSH index to find candidates.
+
+import array
+import hashlib
+import random
+import re
+import struct
+import zlib
+
+# the tokens of a pair, words and single punctuation characters
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+# the hash functions of the signatures are (a * x + b) % _PRIME on 31 bit
+# shingle hashes, so all products fit in a machine int
+_PRIME = (1 << 31) - 1
+
+
+# normalise the code and comment of a pair, so pairs which only differ in
+# whitespace are equal
+def normalise(code, comment):
+    return " ".join(code.split()) + "\n" + " ".join(comment.split())
+
+
+# the hashes of the shingles of n consecutive tokens of a normalised pair
+def shingles(text, n):
+    tokens = _TOKEN.findall(text)
+    if len(tokens) < n:
+        return set([zlib.crc32(" ".join(tokens)) & _PRIME])
+
+    return set(zlib.crc32(" ".join(tokens[i:i + n])) & _PRIME for i in xrange(len(tokens) - n + 1))
+
+
+class Deduplicator(object):
+    """ Decide for a stream of pairs whether each pair duplicates an earlier
+    one. Only the hash of every pair and, with near-duplicate detection, its
+    signature are kept, never the pairs themselves.
+
+    mode is "exact" or "near". A pair is a near-duplicate when the estimated
+    Jaccard similarity of its shingles with an earlier pair is at least
+    threshold. The signatures have bands * rows hash values, pairs which agree
+    on all the rows of any band are compared. """
+
+    def __init__(self, mode="near", threshold=0.8, bands=16, rows=4, shingleSize=3, seed=1):
+        if mode not in ["exact", "near"]:
+            raise ValueError("unknown dedup mode %r" % mode)
+
+        self.mode = mode
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self.shingleSize = shingleSize
+
+        rand = random.Random(seed)
+        self.perms = [(rand.randint(1, _PRIME - 1), rand.randint(0, _PRIME - 1)) for _ in xrange(bands * rows)]
+
+        self.hashes = set()
+        self.buckets = {}
+        self.signatures = array.array('i')
+        self.pairs = 0
+
+    # the MinHash signature of a normalised pair
+    def signature(self, text):
+        hashes = shingles(text, self.shingleSize)
+        return [min((a * h + b) % _PRIME for h in hashes) for (a, b) in self.perms]
+
+    # the estimated Jaccard similarity of the signature with that of pair n
+    def similarity(self, signature, n):
+        size = len(self.perms)
+        other = self.signatures[n * size:(n + 1) * size]
+        return sum(1 for (x, y) in zip(signature, other) if x == y) / float(size)
+
+    # check a pair, returns "exact" or "near" for a duplicate and None for a
+    # new pair, which is remembered
+    def check(self, code, comment):
+        text = normalise(code, comment)
+
+        key = struct.unpack("<q", hashlib.sha1(text).digest()[:8])[0]
+        if key in self.hashes:
+            return "exact"
+
+        self.hashes.add(key)
+        if self.mode == "exact":
+            return None
+
+        signature = self.signature(text)
+        bandKeys = [hash((band,) + tuple(signature[band * self.rows:(band + 1) * self.rows]))
+                    for band in xrange(self.bands)]
+
+        compared = set()
+        for bandKey in bandKeys:
+            for n in self.buckets.get(bandKey, ()):
+                if n in compared:
+                    continue
+                compared.add(n)
+
+                if self.similarity(signature, n) >= self.threshold:
+                    return "near"
+
+        # a new pair, add it to the index
+        n = self.pairs
+        self.pairs += 1
+        self.signatures.extend(signature)
+        for bandKey in bandKeys:
+            self.buckets.setdefault(bandKey, []).append(n)
+
+        return None
@@ -0,0 +1,80 @@
+# Cache of the pairs extracted from every source file, keyed by the hash of the
+# content of the file, so a re-run only has to extract added or changed files
+
+import cPickle
+import hashlib
+import json
+import os
+
+
+class ExtractionCache(object):
+    """ The pairs of a single file are stored in a shard named after the key
+    of the file, the sha1 of the extraction settings and the content of the
+    file. Per repository a manifest maps every file to its key, together with
+    the stamp of the file from its source (the size and modification time or
+    the git blob id), so unchanged files don't need to be read and hashed
+    again. """
+
+    def __init__(self, path, settings):
+        self.path = path
+        self.settings = settings
+
+    def shardFile(self, key):
+        return os.path.join(self.path, "pairs", key[:2], key + ".pickle")
+
+    def manifestFile(self, directory):
+        return os.path.join(self.path, directory + ".manifest.json")
+
+    # the key of a file with the given content
+    def key(self, source):
+        return hashlib.sha1(self.settings + "\0" + source).hexdigest()
+
+    def has(self, key):
+        return os.path.exists(self.shardFile(key))
+
+    # store the pairs and the extraction counts of a file, each pair is a
+    # (code, comment, lineNo, kind) tuple
+    def store(self, key, pairs, counts):
+        shardFile = self.shardFile(key)
+        if not os.path.isdir(os.path.dirname(shardFile)):
+            try:
+                os.makedirs(os.path.dirname(shardFile))
+            except OSError:
+                # created by another worker in the meantime
+                pass
+
+        # write to a temporary file first, so a crash never leaves a partial shard
+        with open(shardFile + ".tmp", 'wb') as fp:
+            cPickle.dump((pairs, dict(counts)), fp, cPickle.HIGHEST_PROTOCOL)
+        os.rename(shardFile + ".tmp", shardFile)
+
+    # load the (pairs, counts) of a file
+    def load(self, key):
+        with open(self.shardFile(key), 'rb') as fp:
+            return cPickle.load(fp)
+
+    def remove(self, key):
+        if self.has(key):
+            os.remove(self.shardFile(key))
+
+    # the manifest of a repository, maps every file to its entry
+    def readManifest(self, directory):
+        if not os.path.exists(self.manifestFile(directory)):
+            return {}
+
+        with open(self.manifestFile(directory)) as fp:
+            manifest = json.load(fp)
+
+        # the files were extracted with other settings, nothing can be reused
+        if manifest.get("settings") != self.settings:
+            return {}
+
+        return dict((file.encode("utf-8"), entry) for (file, entry) in manifest["files"].items())
+
+    def writeManifest(self, directory, files):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        with open(self.manifestFile(directory) + ".tmp", 'w') as fp:
+            json.dump({"settings": self.settings, "files": files}, fp, indent=1, sort_keys=True)
+        os.rename(self.manifestFile(directory) + ".tmp", self.manifestFile(directory))
@@ -2,8 +2,12 @@
 """ Open a file, find all hashtag comments in the file and get the corresponding code"""
 
 from os.path import basename, splitext
+import collections
 import sys
+import lineIndex
+import pairs
 import util
+from lineIndex import BLANK, COMMENT_START, DIVIDER, HAS_COMMENT, DOUBLE_QUOTES, SINGLE_QUOTES
 
 commentList = ["# ", "#!"]
 commentExceptions = ["todo","to do"]
@@ -12,9 +16,26 @@ commentExceptions = ["todo","to do"]
 maxBucket = [40,50]
 
 
-def generate_pairs(source, codeFile, commentFile, maxBucket, module='<string>'):
+def generate_pairs(source, writer, maxBucket, module='<string>'):
     """ Loop through the source code and filter comments and
-    their correspondig code. """
+    their correspondig code. The pairs are written to the PairWriter writer. """
+
+    counts = collections.Counter()
+    for pair in iter_pairs(source, maxBucket, module, counts):
+        writer.write(pair.code, pair.comment)
+
+    return (counts["normal comments"], counts["inline comments"], counts["rejected comments"])
+
+
+def iter_pairs(source, maxBucket, module='<string>', counts=None):
+    """ Loop through the source code and yield the comments and their
+    corresponding code as Pair records, one at a time. The number of normal
+    and rejected comments is added to the dict counts when it is given, the
+    rejected comments are also counted per reason. """
+
+    filename = module
+    if counts is None:
+        counts = collections.Counter()
 
     # open the file
     if hasattr(source, 'read'):
@@ -22,23 +43,28 @@ def generate_pairs(source, codeFile, commentFile, maxBucket, module='<string>'):
         module = splitext(basename(filename))[0]
         source = source.read()
 
-    source = source.splitlines()
-    normalComments = 0
-    inlineComments = 0
-    rejectedComments = 0
+    # the LineIndex of the file can be shared with the other extractor
+    if isinstance(source, lineIndex.LineIndex):
+        index = source
+    else:
+        index = lineIndex.LineIndex(source.splitlines())
+    flags = index.flags
+    counts.setdefault("normal comments", 0)
+    counts.setdefault("inline comments", 0)
+    counts.setdefault("rejected comments", 0)
 
     i = -1
     count = 0 
 
     # check each line for comments
-    while i < len(source):
-        line = source[i]
+    while i < len(index):
 
         # check if the line starts with an comment, if so 
         # get the comment and code, and skip to the correct line after
         # the comment
-        if line.strip()[:2] in commentList:
-            (i, success) = filterComment(source, i, codeFile, commentFile, maxBucket)
+        if flags[i] & COMMENT_START:
+            startLine = i
+            (i, pair, reason) = filterComment(index, i, maxBucket)
 
             if count != 0 and i == count:
                 sys.exit(0)
@@ -46,10 +72,12 @@ def generate_pairs(source, codeFile, commentFile, maxBucket, module='<string>'):
             count = i
 
             # only increment the count if there was no error
-            if success:
-                normalComments += 1
+            if pair is not None:
+                counts["normal comments"] += 1
+                yield pairs.Pair(pair[0], pair[1], filename, startLine + 1, "comment")
             else:
-                rejectedComments += 1
+                counts["rejected comments"] += 1
+                counts["rejected comments: " + reason] = counts.get("rejected comments: " + reason, 0) + 1
             continue
 
         # check if we have an inline comment
@@ -80,99 +108,88 @@ def generate_pairs(source, codeFile, commentFile, maxBucket, module='<string>'):
         # increment by one
         i += 1
 
-    # print "Total comments found: " , normalComments + inlineComments + rejectedComments
-    # print "Normal comments: ", normalComments
-    # print "Inline comments: ", inlineComments
-    # print "Rejected comments: ", rejectedComments
-    return (normalComments, inlineComments, rejectedComments)
-
 
 
-def filterComment(source, startLine, codeFile, commentFile, maxBucket):
-    """ Find the comment at line i in the list source. When found check for 
-    a multiline comment and get the corresponding code """
+def filterComment(index, startLine, maxBucket):
+    """ Find the comment at line i in the LineIndex index. When found check for 
+    a multiline comment and get the corresponding code. Returns the next line,
+    the (code, comment) pair or None if the comment was rejected and the
+    reason of the rejection. """
 
     comment = ""
     indentation = -1
     currIndent = -1
     code = []
-    globalI = len(source) + 10
+    globalI = len(index) + 10
+
+    # the properties of the lines are looked up in the index
+    source = index.lines
+    stripped = index.stripped
+    flags = index.flags
 
     # loop through all the lines in the source, get the comment 
     # and the corresponding code
-    with open(commentFile, "a") as commentF:
-        with open(codeFile, "a") as codeF:
-            for i in xrange(startLine, len(source)):
-
-                globalI = i
-                line = source[i]
-
-                # comments need to be directly above code
-                if line.strip() == "" and comment == "":
-                    return (i,False)
-
-                # Continue if we have an divider row
-                if line.replace("#", "").strip() == "" and line.strip() != "":
-                    continue
-
-                # check if it is an comment, and if so add it to the comment
-                if line.strip()[:2] in commentList:
-                    comment += line.strip().replace("#", "") + " "
-                    continue
-
-                # lines with docstrings are skipped
-                if '"""' in line or "'''" in line:
-                    return (i,False)
-
-                # if we get here, it means we are not in the comment anymore
-                # First get the indentation level of the current line of code
-                currIndent = len(line) - len(line.lstrip())
-
-                # If it is the first line of code, set our indentation level
-                if indentation == -1:
-                    indentation = currIndent
-
-                # if we hit an empty line and have no code yet, return with an error 
-                if line.strip() == "" and code == []:
-                    return (i,False)
-
-                # if we hit an empty line or go to an parent piece in the code
-                # return the gathered code
-                if line.strip() == "" or indentation > currIndent or (any(c in line for c in commentList)):
-                    code = util.cleanCode(code)
-
-                    # no need to save code-comment pairs larger than maxBucket size
-                    if util.tokenize("".join(code)) < maxBucket[0] and util.tokenize(comment) < maxBucket[1] \
-                    and not (any(exc in comment.lower() for exc in commentExceptions)):
-                        # write to file
-                        for j in xrange(len(code)):
-                            codeF.write(code[j] + "\n")
-                        codeF.write("!@#$%!@#$%!@#$%!@#$%!@#$%")
-                        commentF.write(util.cleanComment(comment) + "\n!@#$%!@#$%!@#$%!@#$%!@#$%")
-
-                        return (i,True)
-                    else:
-                        return (i,False)
-
-                # add the line to our code if all is well (without any inline comments if any)
-                if line.strip() != "":
-                    code.append(line)
+    for i in xrange(startLine, len(source)):
+
+        globalI = i
+        lineFlags = flags[i]
+
+        # comments need to be directly above code
+        if lineFlags & BLANK and comment == "":
+            return (i, None, "no code")
+
+        # Continue if we have an divider row
+        if lineFlags & DIVIDER:
+            continue
 
+        # check if it is an comment, and if so add it to the comment
+        if lineFlags & COMMENT_START:
+            comment += stripped[i].replace("#", "") + " "
+            continue
+
+        # lines with docstrings are skipped
+        if lineFlags & (DOUBLE_QUOTES | SINGLE_QUOTES):
+            return (i, None, "docstring in code")
+
+        # if we get here, it means we are not in the comment anymore
+        # First get the indentation level of the current line of code
+        currIndent = index.indent[i]
+
+        # If it is the first line of code, set our indentation level
+        if indentation == -1:
+            indentation = currIndent
+
+        # if we hit an empty line and have no code yet, return with an error 
+        if lineFlags & BLANK and code == []:
+            return (i, None, "no code")
+
+        # if we hit an empty line or go to an parent piece in the code
+        # return the gathered code
+        if lineFlags & (BLANK | HAS_COMMENT) or indentation > currIndent:
             code = util.cleanCode(code)
 
-            # if we are here check if we have a comment / code not empty and smaller than maxBucket size
-            if comment.strip() != "" and code != [] and \
-            util.tokenize("".join(code)) < maxBucket[0] and util.tokenize(comment) < maxBucket[1] \
-            and not (any(exc in comment.lower() for exc in commentExceptions)):
-                # write to file
-                for j in xrange(len(code)):
-                    codeF.write(code[j] + "\n")
-                codeF.write("!@#$%!@#$%!@#$%!@#$%!@#$%")
-                commentF.write(util.cleanComment(comment) + "\n!@#$%!@#$%!@#$%!@#$%!@#$%")
-
-                return (globalI+1,True)
+            # no need to save code-comment pairs larger than maxBucket size
+            reason = util.rejectReason(code, comment, maxBucket, commentExceptions)
+            if reason is None:
+                return (i, (code, util.cleanComment(comment)), None)
             else:
-                return (globalI+1,False)
+                return (i, None, reason)
+
+        # add the line to our code if all is well (without any inline comments if any)
+        if not lineFlags & BLANK:
+            code.append(source[i])
+
+    code = util.cleanCode(code)
+
+    # if we are here check if we have a comment / code not empty and smaller than maxBucket size
+    if comment.strip() == "" or code == []:
+        return (globalI+1, None, "no code")
+
+    reason = util.rejectReason(code, comment, maxBucket, commentExceptions)
+    if reason is None:
+        return (globalI+1, (code, util.cleanComment(comment)), None)
+    else:
+        return (globalI+1, None, reason)
 
 
 if __name__ == '__main__':
@@ -1,40 +1,64 @@
 from os.path import basename, splitext
+import collections
 import sys
+import lineIndex
+import pairs
 import util 
+from lineIndex import BLANK, HAS_COMMENT, DOUBLE_QUOTES, SINGLE_QUOTES, DEF
 
 
 commentList = ["# ", "#!"]
 dsList = ["'''", '"""']
 commentExceptions = ["todo","to do"]
 
-def generate_pairs(source, codeFile, commentFile, maxBucket, module='<string>'):
+def generate_pairs(source, writer, maxBucket, module='<string>'):
+    """ Loop through the source code and filter docstrings and their
+    corresponding code. The pairs are written to the PairWriter writer. """
+
+    counts = collections.Counter()
+    for pair in iter_pairs(source, maxBucket, module, counts):
+        writer.write(pair.code, pair.comment)
+
+    return (counts["normal docstrings"], counts["rejected docstrings"])
+
+
+def iter_pairs(source, maxBucket, module='<string>', counts=None):
+    """ Loop through the source code and yield the docstrings and their
+    corresponding code as Pair records, one at a time. The number of normal
+    and rejected docstrings is added to the dict counts when it is given, the
+    rejected docstrings are also counted per reason. """
+
+    filename = module
+    if counts is None:
+        counts = collections.Counter()
+
     # open the file
     if hasattr(source, 'read'):
         filename = getattr(source, 'name', module)
         module = splitext(basename(filename))[0]
         source = source.read()
 
-    # print "Source:\n" , source
-    source = source.splitlines()
-    normalDocStrings = 0
-    rejectedDocStrings = 0
+    # the LineIndex of the file can be shared with the other extractor
+    if isinstance(source, lineIndex.LineIndex):
+        index = source
+    else:
+        index = lineIndex.LineIndex(source.splitlines())
+    flags = index.flags
+    counts.setdefault("normal docstrings", 0)
+    counts.setdefault("rejected docstrings", 0)
     i = 0
     count = 0
 
     # check each line for comments
-    while i < len(source):
-        # print "Current i:", i
-        line = source[i]
-        # print "Index:", i
-        # print "Current line:" , line
+    while i < len(index):
 
         # if line.strip()[:3] == '"""':
-        if '"""' in line:
+        if flags[i] & DOUBLE_QUOTES:
 
             # print "Current line " , i , ":" , line , " in file:" , filename
             # print "Found docstring"
-            (i, success) = filterDocString(source, i, codeFile, commentFile, maxBucket)
-            # print ">Returned line number:" , i, " with Success:", success
+            startLine = i
+            (i, pair, reason) = filterDocString(index, i, maxBucket)
 
             # Throw an 'error' in case we are looping
             if i == count:
@@ -44,30 +68,34 @@ def generate_pairs(source, codeFile, commentFile, maxBucket, module='<string>'):
             count = i
 
             # only increment the count if there was no error
-            if success:
-                normalDocStrings += 1
+            if pair is not None:
+                counts["normal docstrings"] += 1
+                yield pairs.Pair(pair[0], pair[1], filename, startLine + 1, "docstring")
             else:
-                rejectedDocStrings += 1
+                counts["rejected docstrings"] += 1
+                counts["rejected docstrings: " + reason] = counts.get("rejected docstrings: " + reason, 0) + 1
             continue
 
 
         # increment by one
         i += 1
 
-    # print "Total docstrings found: " , normalDocStrings + rejectedDocStrings
-    # print "Normal docstrings: ", normalDocStrings
-    # print "Rejected docstrings: ", rejectedDocStrings
-
-    return (normalDocStrings, rejectedDocStrings)
-
-def filterDocString(source, startLine, codeFile, commentFile, maxBucket):
+# get the docstring starting at line startLine of the LineIndex index and the code
+# it annotates, returns the next line, the (code, comment) pair or None when
+# rejected and the reason of the rejection
+def filterDocString(index, startLine, maxBucket):
 
     inComment = True
     comment = ""
     indentation = -1
     currIndent = -1
     code = []
-    globalI = len(source) + 10
+    globalI = len(index) + 10
+
+    # the properties of the lines are looked up in the index
+    source = index.lines
+    stripped = index.stripped
+    flags = index.flags
 
     # add the first line to the comment and check for single line docstrings
     count = (source[startLine].count('"""'))
@@ -82,119 +110,98 @@ def filterDocString(source, startLine, codeFile, commentFile, maxBucket):
 
     # loop through all the lines in the source, get the comment 
     # and the corresponding code
-    with open(commentFile, "a") as commentF:
-        with open(codeFile, "a") as codeF:      
-            for i in xrange(startLine, len(source)):
-                # print "i in comment loop is:" , i
-                globalI = i
-                # print "I is:", i, " startline is:" , startLine
-                line = source[i]
-
-                # skip empty lines
-                if line.strip() == "":
-                    # print "Skipped empty line"
-                    continue
-
-                # If it is the first line of code, set our indentation level
-                if indentation == -1:
-                    indentation = currIndent
-
-                # check if there is an block comment inside the docstring annotated code
-                if any(comment in line for comment in commentList):
-                    # print ">>Found block comment, return error"
-                    return (i, False)
-
-                currIndent = len(line) - len(line.lstrip())
-                # print ">>Current indent" , currIndent , " current line:" , line
-
-                if "'''" in line:
-                    return (i,False)
-
-                # check if we have encountered an doc string
-                if '"""' in line:
-
-                    # print ">>Found triple quote"
-
-                    # first if we are at another indentation level, we found an deeper
-                    # docstring, thus exit
-                    if currIndent != indentation or not inComment: 
-                        # print ">>>It is a new comment, return error"
-                        return(i,False)
-                    
-                    # otherwise end the comment
-                    else:
-                        # print ">>>Closed comment"
-                        comment += source[i].strip().replace('"""', "").replace("#","") + " "
-                        inComment = False
-                        continue
-
-                # add text to the comment if it hasn't closed yet
-                if inComment:
-                    comment += line.strip().replace("#","") + " "
-                    continue
-
-                # if we are still here, we have closed the comment and are collecting code
-
-                # return true if we found the end of the annotated code
-                if indentation > currIndent:
-                    code = util.cleanCode(code)
-                    # only return true if we are in a function def,
-                    # also no need to save code-comment pairs larger than maxBucket size
-                    if  not isDef(source, startLine, i) or \
-                        not (util.tokenize("".join(code)) < maxBucket[0] and util.tokenize(comment) < maxBucket[1]) or \
-                        (any(exc in comment.lower() for exc in commentExceptions)):
-
-                        return (i, False)
-
-                    # write to file
-                    for j in xrange(len(code)):
-                        codeF.write(code[j] + "\n")
-                    codeF.write("!@#$%!@#$%!@#$%!@#$%!@#$%")
-                    commentF.write(util.cleanComment(comment) + "\n!@#$%!@#$%!@#$%!@#$%!@#$%")
-
-                    return(i, True)
-                
-                # if we are still here, add the current line to the code
-                code.append(line.strip())
-
-            # print ">>Got to the end with i:" , globalI
-            if comment != "" and code != []:
-                code = util.cleanCode(code)
-
-                # only return true if we are in a function def
-                # also no need to save code-comment pairs larger than maxBucket size
-                if  not isDef(source, startLine, i) or \
-                    not (util.tokenize("".join(code)) < maxBucket[0] and util.tokenize(comment) < maxBucket[1]) or \
-                    (any(exc in comment.lower() for exc in commentExceptions)):
-                    return (globalI+1, False)
-
-               # write to file
-                for j in xrange(len(code)):
-                    codeF.write(code[j] + "\n")
-                codeF.write("!@#$%!@#$%!@#$%!@#$%!@#$%")
-                commentF.write(util.cleanComment(comment) + "\n!@#$%!@#$%!@#$%!@#$%!@#$%")
-                # codeF.write(" ".join([x.strip() for x in code]) + "\n")
-
-                # print "Comment:" , comment
-                # print "Code:" , code, "\n"
-                return (globalI+1, True)
+    for i in xrange(startLine, len(source)):
+        # print "i in comment loop is:" , i
+        globalI = i
+        lineFlags = flags[i]
+
+        # skip empty lines
+        if lineFlags & BLANK:
+            continue
+
+        # If it is the first line of code, set our indentation level
+        if indentation == -1:
+            indentation = currIndent
+
+        # check if there is an block comment inside the docstring annotated code
+        if lineFlags & HAS_COMMENT:
+            # print ">>Found block comment, return error"
+            return (i, None, "block comment")
+
+        currIndent = index.indent[i]
+
+        if lineFlags & SINGLE_QUOTES:
+            return (i, None, "single quotes")
+
+        # check if we have encountered an doc string
+        if lineFlags & DOUBLE_QUOTES:
+
+            # print ">>Found triple quote"
+
+            # first if we are at another indentation level, we found an deeper
+            # docstring, thus exit
+            if currIndent != indentation or not inComment: 
+                # print ">>>It is a new comment, return error"
+                return (i, None, "nested docstring")
+            
+            # otherwise end the comment
             else:
-                return (globalI+1, False)
+                # print ">>>Closed comment"
+                comment += stripped[i].replace('"""', "").replace("#","") + " "
+                inComment = False
+                continue
+
+        # add text to the comment if it hasn't closed yet
+        if inComment:
+            comment += stripped[i].replace("#","") + " "
+            continue
+
+        # if we are still here, we have closed the comment and are collecting code
+
+        # return true if we found the end of the annotated code
+        if indentation > currIndent:
+            code = util.cleanCode(code)
+            # only return true if we are in a function def,
+            # also no need to save code-comment pairs larger than maxBucket size
+            if not isDef(index, startLine):
+                return (i, None, "not a function")
+
+            reason = util.rejectReason(code, comment, maxBucket, commentExceptions)
+            if reason is not None:
+                return (i, None, reason)
+
+            return (i, (code, util.cleanComment(comment)), None)
+        
+        # if we are still here, add the current line to the code
+        code.append(stripped[i])
+
+    # print ">>Got to the end with i:" , globalI
+    if comment != "" and code != []:
+        code = util.cleanCode(code)
+
+        # only return true if we are in a function def
+        # also no need to save code-comment pairs larger than maxBucket size
+        if not isDef(index, startLine):
+            return (globalI+1, None, "not a function")
+
+        reason = util.rejectReason(code, comment, maxBucket, commentExceptions)
+        if reason is not None:
+            return (globalI+1, None, reason)
+
+        return (globalI+1, (code, util.cleanComment(comment)), None)
+    else:
+        return (globalI+1, None, "no code")
 
 
 
 # check if we are in a function definition
-def isDef(source, startLine, i):
+def isDef(index, startLine):
     # check the previous line
-    containsDef = "def" in source[startLine - 1]
+    containsDef = index.flags[startLine - 1] & DEF != 0
 
     # if we are not sure, check the rest of the source
     if not containsDef:
-        for i in xrange(startLine, len(source)):
-            if "def" in source[i]:
-                containsDef = True
-
-    # print "Contains Def:" , containsDef
+        containsDef = index.nextDef[startLine] < len(index)
 
     return containsDef
 
@@ -0,0 +1,155 @@
+""" Find the docstrings of all function definitions with the ast module and get
+the code of the function body that follows them. The source is parsed once and
+every line is visited a constant number of times, so unlike the line scanner in
+getDocStrings the extraction is linear in the length of the file. """
+
+from os.path import basename, splitext
+import ast
+import collections
+import pairs
+import util
+
+from getDocStrings import commentList, dsList, commentExceptions
+
+
+def generate_pairs(source, writer, maxBucket, module='<string>'):
+    """ Loop through the functions in the source code and filter their
+    docstrings and code. The pairs are written to the PairWriter writer. """
+
+    counts = collections.Counter()
+    for pair in iter_pairs(source, maxBucket, module, counts):
+        writer.write(pair.code, pair.comment)
+
+    return (counts["normal docstrings"], counts["rejected docstrings"])
+
+
+def iter_pairs(source, maxBucket, module='<string>', counts=None):
+    """ Parse the source code and yield the function docstrings and the code
+    of the function bodies as Pair records, in the order of the functions in
+    the file. The number of normal and rejected docstrings is added to the dict
+    counts when it is given, the rejected docstrings are also counted per
+    reason. Files which can't be parsed yield nothing. """
+
+    filename = module
+    if counts is None:
+        counts = collections.Counter()
+
+    # open the file
+    if hasattr(source, 'read'):
+        filename = getattr(source, 'name', module)
+        module = splitext(basename(filename))[0]
+        source = source.read()
+
+    counts.setdefault("normal docstrings", 0)
+    counts.setdefault("rejected docstrings", 0)
+
+    try:
+        tree = ast.parse(source, filename)
+    except (SyntaxError, TypeError, ValueError):
+        # invalid python, or null bytes in the source
+        return
+
+    # the line numbers of the ast start counting at 1
+    source = source.split("\n")
+
+    for (function, lastLine) in functionDefs(tree.body, len(source)):
+        pair = filterFunction(source, function, lastLine, maxBucket)
+        if pair is None:
+            continue
+
+        # a rejected pair holds the reason of the rejection instead of the comment
+        (code, comment) = pair
+        if code is None:
+            counts["rejected docstrings"] += 1
+            counts["rejected docstrings: " + comment] = counts.get("rejected docstrings: " + comment, 0) + 1
+            continue
+
+        counts["normal docstrings"] += 1
+        yield pairs.Pair(code, comment, filename, function.lineno, "docstring")
+
+
+# yield all function definitions in the statements body together with the last
+# line they can span, which is the line before the next statement in the same
+# block or the last line of the enclosing block
+def functionDefs(body, lastLine):
+    for (i, node) in enumerate(body):
+        nodeLastLine = lastLine
+        if i + 1 < len(body):
+            nodeLastLine = body[i + 1].lineno - 1
+
+        if isinstance(node, ast.FunctionDef):
+            yield (node, nodeLastLine)
+
+        # simple statements have no blocks
+        if not hasattr(node, "body"):
+            continue
+
+        # visit the blocks of compound statements, in the order of the source
+        blocks = childBlocks(node)
+        for (j, block) in enumerate(blocks):
+            blockLastLine = nodeLastLine
+            if j + 1 < len(blocks):
+                blockLastLine = blocks[j + 1][0].lineno - 1
+
+            for result in functionDefs(block, blockLastLine):
+                yield result
+
+
+# get the statement blocks of a compound statement
+def childBlocks(node):
+    blocks = []
+    for field in ["body", "handlers", "orelse", "finalbody"]:
+        value = getattr(node, field, None)
+        if not isinstance(value, list) or value == []:
+            continue
+
+        if field == "handlers":
+            blocks.extend(handler.body for handler in value)
+        elif isinstance(value[0], ast.stmt):
+            blocks.append(value)
+
+    return blocks
+
+
+# get the docstring and code of a function definition, returns None if the
+# function has no docstring, (None, reason) if the pair is rejected and the
+# (code, comment) pair otherwise
+def filterFunction(source, function, lastLine, maxBucket):
+    docstring = function.body[0]
+    if not (isinstance(docstring, ast.Expr) and isinstance(docstring.value, ast.Str)):
+        return None
+
+    comment = docstring.value.s
+    if isinstance(comment, unicode):
+        comment = comment.encode("utf-8")
+    comment = " ".join(line.strip().replace("#", "") for line in comment.splitlines() if line.strip() != "")
+
+    # before python 3.8 the line number of a multiline string is its last line
+    docstringEnd = getattr(docstring, "end_lineno", docstring.lineno)
+
+    # lines after the function at the indentation of the def (comments, the
+    # else of an enclosing if statement) don't belong to the function
+    lines = source[docstringEnd:lastLine]
+    while lines and (lines[-1].strip() == "" or
+                     len(lines[-1]) - len(lines[-1].lstrip()) <= function.col_offset):
+        lines.pop()
+
+    code = [line.strip() for line in lines if line.strip() != ""]
+
+    # block comments and nested docstrings in the code are rejected
+    if any(c in line for line in code for c in commentList):
+        return (None, "block comment")
+    if any(c in line for line in code for c in dsList):
+        return (None, "nested docstring")
+
+    code = util.cleanCode(code)
+
+    if comment == "" or code == []:
+        return (None, "no code")
+
+    # no need to save code-comment pairs larger than maxBucket size
+    reason = util.rejectReason(code, comment, maxBucket, commentExceptions)
+    if reason is not None:
+        return (None, reason)
+
+    return (code, util.cleanComment(comment))
@@ -0,0 +1,59 @@
+# Per-file index of the properties of every line, shared by the comment and
+# docstring extractors so each line is only stripped and searched once
+
+import array
+
+commentList = ["# ", "#!"]
+
+# bit flags of a line
+BLANK = 1
+COMMENT_START = 2
+DIVIDER = 4
+HAS_COMMENT = 8
+DOUBLE_QUOTES = 16
+SINGLE_QUOTES = 32
+DEF = 64
+
+
+class LineIndex(object):
+    """ Precomputed properties of the lines of a file. The indentation and the
+    flags of line i are stored in the arrays indent and flags, the stripped
+    line in stripped. nextDef[i] is the first line at or after i containing
+    "def", or the number of lines if there is none. """
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.stripped = [line.strip() for line in lines]
+        self.indent = array.array('i', [0] * len(lines))
+        self.flags = array.array('B', [0] * len(lines))
+        self.nextDef = array.array('i', [len(lines)] * (len(lines) + 1))
+
+        for (i, line) in enumerate(lines):
+            stripped = self.stripped[i]
+            self.indent[i] = len(line) - len(line.lstrip())
+
+            flags = 0
+            if stripped == "":
+                flags |= BLANK
+            elif line.replace("#", "").strip() == "":
+                flags |= DIVIDER
+            if stripped[:2] in commentList:
+                flags |= COMMENT_START
+            if "# " in line or "#!" in line:
+                flags |= HAS_COMMENT
+            if '"""' in line:
+                flags |= DOUBLE_QUOTES
+            if "'''" in line:
+                flags |= SINGLE_QUOTES
+            if "def" in line:
+                flags |= DEF
+            self.flags[i] = flags
+
+        for i in xrange(len(lines) - 1, -1, -1):
+            if self.flags[i] & DEF:
+                self.nextDef[i] = i
+            else:
+                self.nextDef[i] = self.nextDef[i + 1]
+
+    def __len__(self):
+        return len(self.lines)
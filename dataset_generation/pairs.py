@@ -0,0 +1,153 @@
+# The extracted code-comment pairs and the writers for them
+
+import collections
+import records
+
+# the string which seperates the pairs in the raw files
+delimiter = "!@#$%!@#$%!@#$%!@#$%!@#$%"
+
+# A single extracted pair: the code lines, the comment, the file and line
+# number where the comment starts and the kind ("comment" or "docstring").
+# The extractors yield these records so the pairs can be processed as a
+# stream, without writing the raw files first.
+Pair = collections.namedtuple("Pair", ["code", "comment", "sourceFile", "lineNo", "kind"])
+
+# size of the write buffer of each output file
+bufferSize = 1 << 20
+
+
+class PairWriter(object):
+    """ Write code-comment pairs to a code file and a comment file. Both files
+    stay open until the writer is closed and all writes are buffered.
+
+    The pairs are written in the raw format, the code lines followed by the
+    delimiter and the comment followed by a newline and the delimiter. Other
+    formats can be written by overriding formatCode and formatComment.
+
+    With a sourceFile the source file and line number of every pair are
+    written to it as well, a "file<tab>line" line per pair. """
+
+    def __init__(self, codeFile, commentFile, sourceFile=None):
+        self.codeFile = codeFile
+        self.commentFile = commentFile
+        self.sourceFile = sourceFile
+        self.codeF = open(codeFile, 'w', bufferSize)
+        self.commentF = open(commentFile, 'w', bufferSize)
+        self.sourceF = open(sourceFile, 'w', bufferSize) if sourceFile else None
+        self.pairs = 0
+
+    def formatCode(self, code):
+        return "".join(line + "\n" for line in code) + delimiter
+
+    def formatComment(self, comment):
+        return comment + "\n" + delimiter
+
+    def formatSource(self, sourceFile, lineNo):
+        return "%s\t%d\n" % (sourceFile.replace("\n", " "), lineNo)
+
+    # write a single pair, code is a list of lines and comment a string
+    def write(self, code, comment, sourceFile="", lineNo=0):
+        self.codeF.write(self.formatCode(code))
+        self.commentF.write(self.formatComment(comment))
+        if self.sourceF is not None:
+            self.sourceF.write(self.formatSource(sourceFile, lineNo))
+        self.pairs += 1
+
+    # write a Pair record, the kind is given by the files it is written to
+    def writePair(self, pair):
+        self.write(pair.code, pair.comment, pair.sourceFile, pair.lineNo)
+
+    def flush(self):
+        for f in [self.codeF, self.commentF, self.sourceF]:
+            if f is not None:
+                f.flush()
+
+    def close(self):
+        for f in [self.codeF, self.commentF, self.sourceF]:
+            if f is not None:
+                f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# yield the pieces of a raw file seperated by the delimiter, the file is read
+# in blocks so only the current piece is kept in memory
+def iterDelimited(fp, blockSize=bufferSize):
+    rest = ""
+    while True:
+        block = fp.read(blockSize)
+        if block == "":
+            break
+
+        pieces = (rest + block).split(delimiter)
+        rest = pieces.pop()
+        for piece in pieces:
+            yield piece
+
+    yield rest
+
+
+# parse a line of a source file written by PairWriter into the source file and
+# line number, an empty line gives ("", 0)
+def parseSource(line):
+    (sourceFile, _, lineNo) = line.rstrip("\n").rpartition("\t")
+    if sourceFile == "":
+        return ("", 0)
+    return (sourceFile, int(lineNo))
+
+
+# encode a Pair into the fields of a record
+def encodePair(pair):
+    return ["\n".join(pair.code), pair.comment, pair.sourceFile, str(pair.lineNo), pair.kind]
+
+
+# decode the fields of a record into a Pair
+def decodePair(fields):
+    (code, comment, sourceFile, lineNo, kind) = fields
+    return Pair(code.split("\n"), comment, sourceFile, int(lineNo), kind)
+
+
+class RecordPairWriter(object):
+    """ Write pairs to a single record file (see records), every record holds
+    the code, comment, source file, line number and kind of a pair. There is
+    no delimiter, so any text can appear in the code and comments. """
+
+    def __init__(self, pairsFile):
+        self.pairsFile = pairsFile
+        self.writer = records.RecordWriter(pairsFile)
+        self.pairs = 0
+
+    def write(self, code, comment, sourceFile="", lineNo=0, kind=""):
+        self.writePair(Pair(code, comment, sourceFile, lineNo, kind))
+
+    def writePair(self, pair):
+        self.writer.write(encodePair(pair))
+        self.pairs += 1
+
+    def flush(self):
+        self.writer.flush()
+
+    def close(self):
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RecordPairReader(records.RecordReader):
+    """ Read the pairs of a record file written by a RecordPairWriter, either
+    as a stream or pair n with reader[n]. """
+
+    def __getitem__(self, n):
+        return decodePair(records.RecordReader.__getitem__(self, n))
+
+    def __iter__(self):
+        for fields in records.RecordReader.__iter__(self):
+            yield decodePair(fields)
@@ -0,0 +1,89 @@
+# Manifests of the parts of a multi-node extraction. Every part of a
+# repository is extracted into its own raw files, after which a manifest with
+# the checksums of those files is written next to them. A part is complete
+# only when its manifest exists and the files match their checksums, so a
+# crashed node leaves no part that looks complete.
+
+import hashlib
+import json
+import os
+
+manifestExt = ".manifest.json"
+blockSize = 1 << 20
+
+
+# the sha1 of the content of a file
+def checksum(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(blockSize), ""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+# the sha1 of a list of file names, to check that a part covers the same files
+def fileListHash(files):
+    digest = hashlib.sha1()
+    for file in files:
+        if isinstance(file, unicode):
+            file = file.encode("utf-8")
+        digest.update(file + "\0")
+
+    return digest.hexdigest()
+
+
+def manifestFile(prefix):
+    return prefix + manifestExt
+
+
+# write the manifest of a part with the given prefix, info describes the part
+# and files are the output files of the part
+def write(prefix, info, files):
+    manifest = dict(info)
+    manifest["outputs"] = dict((os.path.basename(file), {"sha1": checksum(file), "bytes": os.path.getsize(file)})
+                               for file in files)
+
+    with open(manifestFile(prefix) + ".tmp", 'w') as fp:
+        json.dump(manifest, fp, indent=1, sort_keys=True)
+    os.rename(manifestFile(prefix) + ".tmp", manifestFile(prefix))
+
+
+# read the manifest of a part, None if it has not been written
+def read(prefix):
+    if not os.path.exists(manifestFile(prefix)):
+        return None
+
+    with open(manifestFile(prefix)) as fp:
+        return json.load(fp)
+
+
+# check that all output files of a manifest in the directory exist and match
+# their checksums, returns the list of problems
+def verify(manifest, directory):
+    problems = []
+    for (name, output) in sorted(manifest["outputs"].items()):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            problems.append("%s is missing" % name)
+        elif os.path.getsize(path) != output["bytes"] or checksum(path) != output["sha1"]:
+            problems.append("%s does not match its checksum" % name)
+
+    return problems
+
+
+# remove the manifest of a part and the output files it lists in the directory
+def remove(prefix, manifest, directory):
+    os.remove(manifestFile(prefix))
+    for name in manifest["outputs"]:
+        if os.path.exists(os.path.join(directory, name)):
+            os.remove(os.path.join(directory, name))
+
+
+# the prefixes of all parts with a manifest in the directory
+def listParts(directory):
+    if not os.path.isdir(directory):
+        return []
+
+    return sorted(os.path.join(directory, name[:-len(manifestExt)])
+                  for name in os.listdir(directory) if name.endswith(manifestExt))
@@ -0,0 +1,168 @@
+# Binary record files: every record is a list of byte string fields, stored
+# length-prefixed after each other. A sidecar index holds the offset of every
+# record, so a file can be streamed or record n can be read directly without
+# loading or splitting the whole file.
+
+import mmap
+import os
+import struct
+
+magic = "CCREC001"
+indexExt = ".idx"
+
+_length = struct.Struct("<I")
+_offset = struct.Struct("<Q")
+
+# size of the write buffer of the data and index file
+bufferSize = 1 << 20
+
+
+# encode a list of fields into the payload of a record
+def encode(fields):
+    return "".join(_length.pack(len(field)) + field for field in fields)
+
+
+# decode the payload of a record into its list of fields
+def decode(payload):
+    fields = []
+    pos = 0
+    while pos < len(payload):
+        (length,) = _length.unpack_from(payload, pos)
+        pos += _length.size
+        fields.append(payload[pos:pos + length])
+        pos += length
+
+    return fields
+
+
+class RecordWriter(object):
+    """ Append records to a new record file and its index. """
+
+    def __init__(self, path):
+        self.path = path
+        self.fp = open(path, 'wb', bufferSize)
+        self.indexFp = open(path + indexExt, 'wb', bufferSize)
+        self.fp.write(magic)
+        self.offset = len(magic)
+        self.records = 0
+
+    # write an already encoded record, returns the number of the record
+    def writeRaw(self, payload):
+        self.indexFp.write(_offset.pack(self.offset))
+        self.fp.write(_length.pack(len(payload)))
+        self.fp.write(payload)
+        self.offset += _length.size + len(payload)
+        self.records += 1
+        return self.records - 1
+
+    def write(self, fields):
+        return self.writeRaw(encode(fields))
+
+    def flush(self):
+        self.fp.flush()
+        self.indexFp.flush()
+
+    def close(self):
+        self.fp.close()
+        self.indexFp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RecordReader(object):
+    """ Read the records of a record file. Iterating streams the records in
+    order, reader[n] seeks directly to record n using the index. """
+
+    def __init__(self, path):
+        self.path = path
+        self.fp = open(path, 'rb')
+        if self.fp.read(len(magic)) != magic:
+            self.fp.close()
+            raise ValueError("%s is not a record file" % path)
+
+        if not os.path.exists(path + indexExt):
+            buildIndex(path)
+
+        # map the index instead of reading it, it can be larger than the memory
+        self.indexFp = open(path + indexExt, 'rb')
+        self.count = os.fstat(self.indexFp.fileno()).st_size // _offset.size
+        self.index = None
+        if self.count > 0:
+            self.index = mmap.mmap(self.indexFp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.count
+
+    def offset(self, n):
+        return _offset.unpack_from(self.index, n * _offset.size)[0]
+
+    # read the encoded payload of record n
+    def readRaw(self, n):
+        if n < 0:
+            n += self.count
+        if not 0 <= n < self.count:
+            raise IndexError("record %d out of range" % n)
+
+        self.fp.seek(self.offset(n))
+        (length,) = _length.unpack(self.fp.read(_length.size))
+        return self.fp.read(length)
+
+    def __getitem__(self, n):
+        return decode(self.readRaw(n))
+
+    # stream the encoded payloads of all records
+    def iterRaw(self):
+        with open(self.path, 'rb', bufferSize) as fp:
+            fp.seek(len(magic))
+            for payload in iterPayloads(fp):
+                yield payload
+
+    def __iter__(self):
+        for payload in self.iterRaw():
+            yield decode(payload)
+
+    def close(self):
+        if self.index is not None:
+            self.index.close()
+        self.indexFp.close()
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# yield the payloads of the records from the current position in the file
+def iterPayloads(fp):
+    while True:
+        header = fp.read(_length.size)
+        if len(header) < _length.size:
+            return
+
+        (length,) = _length.unpack(header)
+        payload = fp.read(length)
+
+        # the last record of a file that was not closed properly
+        if len(payload) < length:
+            return
+
+        yield payload
+
+
+# recreate the index of a record file, for example after a crash
+def buildIndex(path):
+    with open(path, 'rb', bufferSize) as fp:
+        if fp.read(len(magic)) != magic:
+            raise ValueError("%s is not a record file" % path)
+
+        with open(path + indexExt, 'wb', bufferSize) as indexFp:
+            offset = len(magic)
+            for payload in iterPayloads(fp):
+                indexFp.write(_offset.pack(offset))
+                offset += _length.size + len(payload)
@@ -0,0 +1,282 @@
+# Source providers: the python files of a repository read from an unpacked
+# directory, a tar or zip archive or a bare git repository. Archives and git
+# objects are read directly, nothing is extracted to disk.
+
+import os
+import subprocess
+import tarfile
+import zipfile
+
+# scandir avoids a stat call per directory entry, python 2 needs the backport
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+tarExts = [".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2"]
+zipExts = [".zip"]
+
+
+class Source(object):
+    """ The python files of a repository. files() lists the names of the
+    files in a fixed order, iterSources(files) yields the (file, source)
+    tuples of the given files in that order and stamp(file) returns a value
+    which changes when the file changes, without reading the file.
+
+    The sources are pickled into the tasks of the worker processes, a worker
+    reads the files of its shard itself. """
+
+    def __init__(self, path):
+        self.path = path
+        self.stamps = {}
+
+    # the name of a member of an archive or repository, as it appears in the pairs
+    def fileName(self, member):
+        return self.path + "/" + member
+
+    def member(self, file):
+        return file[len(self.path) + 1:]
+
+    def stamp(self, file):
+        return self.stamps[file]
+
+    def read(self, file):
+        for (_, source) in self.iterSources([file]):
+            return source
+
+    # split the files into shards of at most size files, as (source, files)
+    # tuples a worker can read
+    def shards(self, files, size):
+        for start in xrange(0, len(files), size):
+            yield (self, files[start:start + size])
+
+    # the stamps are only needed in the main process
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["stamps"] = {}
+        return state
+
+
+class DirectorySource(Source):
+    """ An unpacked repository, the files are found by walking the directory
+    tree in sorted order. """
+
+    def fileName(self, member):
+        return member
+
+    def member(self, file):
+        return file
+
+    def files(self):
+        fileList = []
+        stack = [self.path]
+        while stack:
+            (dirs, files) = listDirectory(stack.pop())
+            fileList.extend(files)
+
+            # visit the subdirectories in sorted order
+            stack.extend(reversed(dirs))
+
+        return fileList
+
+    def stamp(self, file):
+        stat = os.stat(file)
+        return [stat.st_size, stat.st_mtime]
+
+    def iterSources(self, files):
+        for file in files:
+            with open(file) as fp:
+                yield (file, fp.read())
+
+
+class ZipSource(Source):
+    """ A zip archive, the members are read directly from the archive. """
+
+    def files(self):
+        with zipfile.ZipFile(self.path) as archive:
+            infos = [info for info in archive.infolist() if info.filename.endswith(".py")]
+
+        for info in infos:
+            self.stamps[self.fileName(info.filename)] = [info.file_size, info.CRC]
+
+        return [self.fileName(info.filename) for info in infos]
+
+    def iterSources(self, files):
+        with zipfile.ZipFile(self.path) as archive:
+            for file in files:
+                yield (file, archive.read(self.member(file)))
+
+
+class TarSource(Source):
+    """ A (compressed) tar archive. A compressed archive can only be read from
+    the start, so it is streamed once and the shards carry the content of
+    their files instead of being read by the workers. """
+
+    def files(self):
+        fileList = []
+        with tarfile.open(self.path, "r|*") as archive:
+            for info in archive:
+                if info.isfile() and info.name.endswith(".py"):
+                    file = self.fileName(info.name)
+                    self.stamps[file] = [info.size, info.mtime]
+                    fileList.append(file)
+
+        return fileList
+
+    # yield the given files in the order of the archive
+    def iterSources(self, files):
+        wanted = set(self.member(file) for file in files)
+        with tarfile.open(self.path, "r|*") as archive:
+            for info in archive:
+                if info.name in wanted and info.isfile():
+                    wanted.discard(info.name)
+                    yield (self.fileName(info.name), archive.extractfile(info).read())
+                    if not wanted:
+                        break
+
+    def shards(self, files, size):
+        shard = []
+        for (file, source) in self.iterSources(files):
+            shard.append((file, source))
+            if len(shard) == size:
+                yield (MemorySource(self.path, shard), [file for (file, _) in shard])
+                shard = []
+
+        if shard:
+            yield (MemorySource(self.path, shard), [file for (file, _) in shard])
+
+
+class MemorySource(Source):
+    """ Files of which the content was already read, a shard of an archive
+    that can't be read by the workers themselves. """
+
+    def __init__(self, path, items):
+        Source.__init__(self, path)
+        self.contents = dict(items)
+
+    def files(self):
+        return sorted(self.contents)
+
+    def iterSources(self, files):
+        for file in files:
+            yield (file, self.contents[file])
+
+
+class GitSource(Source):
+    """ A bare git repository at a revision. The files are the python blobs
+    in the tree of the revision, read with git cat-file. The revision is
+    resolved to a commit once, so every worker reads the same tree, and the
+    stamp of a file is its blob id. """
+
+    def __init__(self, path, revision="HEAD"):
+        Source.__init__(self, path)
+        self.revision = revision
+        self.commit = self.git("rev-parse", "--verify", revision + "^{commit}").strip()
+        self.blobs = {}
+
+    def git(self, *args):
+        return subprocess.check_output(["git", "--git-dir=" + self.path] + list(args))
+
+    def fileName(self, member):
+        return self.path + "@" + self.revision + "/" + member
+
+    def member(self, file):
+        return file[len(self.path) + len(self.revision) + 2:]
+
+    def files(self):
+        fileList = []
+        for entry in self.git("ls-tree", "-r", "-z", "--full-tree", self.commit).split("\0"):
+            if entry == "":
+                continue
+
+            (info, member) = entry.split("\t", 1)
+            (mode, kind, blob) = info.split()
+
+            # skip symbolic links and submodules
+            if kind == "blob" and mode != "120000" and member.endswith(".py"):
+                file = self.fileName(member)
+                self.blobs[file] = blob
+                fileList.append(file)
+
+        return fileList
+
+    def stamp(self, file):
+        return self.blobs[file]
+
+    def iterSources(self, files):
+        git = subprocess.Popen(["git", "--git-dir=" + self.path, "cat-file", "--batch"],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            for file in files:
+                git.stdin.write("%s:%s\n" % (self.commit, self.member(file)))
+                git.stdin.flush()
+
+                header = git.stdout.readline().split()
+                if len(header) != 3:
+                    raise IOError("can't read %s from %s" % (file, self.path))
+
+                source = git.stdout.read(int(header[2]))
+                git.stdout.read(1)
+                yield (file, source)
+        finally:
+            git.stdin.close()
+            git.wait()
+
+    def __getstate__(self):
+        state = Source.__getstate__(self)
+        state["blobs"] = {}
+        return state
+
+
+# list the subdirectories and python files in a directory, sorted so the
+# order of the files is the same on every run
+def listDirectory(directory):
+    dirs = []
+    files = []
+
+    if scandir is not None:
+        for entry in scandir(directory):
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.path)
+            elif entry.name.endswith(".py") and entry.is_file():
+                files.append(entry.path)
+    else:
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                dirs.append(path)
+            elif name.endswith(".py") and os.path.isfile(path):
+                files.append(path)
+
+    return (sorted(dirs), sorted(files))
+
+
+# check if a directory is a bare git repository
+def isBareRepository(path):
+    return os.path.isfile(os.path.join(path, "HEAD")) and os.path.isdir(os.path.join(path, "objects"))
+
+
+# open the source provider for a path: a directory, a tar or zip archive or a
+# bare git repository, optionally followed by @revision
+def openSource(path):
+    (repository, _, revision) = path.partition("@")
+    if revision != "" and isBareRepository(repository):
+        return GitSource(repository, revision)
+
+    if os.path.isdir(path):
+        if isBareRepository(path):
+            return GitSource(path)
+        return DirectorySource(path)
+
+    if not os.path.isfile(path):
+        raise IOError("%s does not exist" % path)
+
+    if any(path.endswith(ext) for ext in zipExts):
+        return ZipSource(path)
+    if any(path.endswith(ext) for ext in tarExts):
+        return TarSource(path)
+
+    raise ValueError("%s is not a directory, archive or git repository" % path)
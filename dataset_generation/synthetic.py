@@ -0,0 +1,108 @@
+# Generators of synthetic python files for the benchmarks. Every generator
+# takes the number of lines and returns the source of a file of about that
+# length, the same source for the same arguments.
+
+import collections
+import random
+
+words = ["return", "the", "value", "of", "list", "index", "file", "name", "check", "if",
+         "get", "set", "update", "count", "items", "data", "result", "number", "a", "new"]
+
+
+def sentence(rand, length):
+    return " ".join(rand.choice(words) for _ in xrange(length))
+
+
+# the lines of a function with an optional docstring, comments are placed
+# above a statement with probability commentDensity
+def function(rand, index, indent, commentDensity, docstringDensity):
+    pad = " " * indent
+    lines = [pad + "def function%d(self, a, b):" % index]
+
+    if rand.random() < docstringDensity:
+        docstring = [sentence(rand, rand.randint(4, 12)) for _ in xrange(rand.randint(1, 3))]
+        if len(docstring) == 1:
+            lines.append(pad + '    """%s"""' % docstring[0])
+        else:
+            lines.append(pad + '    """' + docstring[0])
+            lines.extend(pad + "    " + line for line in docstring[1:])
+            lines.append(pad + '    """')
+
+    for statement in xrange(rand.randint(3, 8)):
+        if rand.random() < commentDensity:
+            lines.append(pad + "    # " + sentence(rand, rand.randint(3, 10)))
+        lines.append(pad + "    value%d = self.%s_%d(a, b[%d]) + %d" % (statement, rand.choice(words), index, statement, index))
+
+    lines.append(pad + "    return value0")
+    lines.append("")
+    return lines
+
+
+# a typical file: classes with methods, commentDensity of the statements have
+# a comment and docstringDensity of the functions a docstring
+def typical(lines, commentDensity=0.2, docstringDensity=0.5, seed=0):
+    rand = random.Random(seed)
+    source = []
+    index = 0
+    while len(source) < lines:
+        source.append("class Class%d(object):" % index)
+        for _ in xrange(rand.randint(2, 6)):
+            source.extend(function(rand, index, 4, commentDensity, docstringDensity))
+            index += 1
+
+    return "\n".join(source) + "\n"
+
+
+def denseComments(lines):
+    return typical(lines, commentDensity=0.9, docstringDensity=1.0)
+
+
+# functions nested in deeply indented blocks, every level has a comment
+def deepNesting(lines, depth=30, seed=0):
+    rand = random.Random(seed)
+    source = []
+    index = 0
+    while len(source) < lines:
+        for level in xrange(depth):
+            source.append(" " * (4 * level) + "# " + sentence(rand, 5))
+            source.append(" " * (4 * level) + "if value%d:" % level)
+        source.extend(function(rand, index, 4 * depth, 0.5, 1.0))
+        index += 1
+
+    return "\n".join(source) + "\n"
+
+
+# a single function with a docstring spanning almost the whole file
+def hugeDocstring(lines, seed=0):
+    rand = random.Random(seed)
+    source = ["def function(self, a, b):", '    """' + sentence(rand, 8)]
+    source.extend("    " + sentence(rand, 10) for _ in xrange(max(lines - 5, 0)))
+    source.append('    """')
+    source.append("    return a + b")
+    return "\n".join(source) + "\n"
+
+
+# module level code with comments and string blocks but without any function,
+# the docstring scanner has to check every string for a def
+def noDefs(lines, seed=0):
+    rand = random.Random(seed)
+    source = []
+    index = 0
+    while len(source) < lines:
+        source.append('"""' + sentence(rand, 8) + '"""')
+        source.append("# " + sentence(rand, 6))
+        source.append("value%d = %d" % (index, index))
+        source.append("")
+        index += 1
+
+    return "\n".join(source) + "\n"
+
+
+# the benchmark cases, name and generator
+cases = collections.OrderedDict([
+    ("typical", typical),
+    ("dense comments", denseComments),
+    ("deep nesting", deepNesting),
+    ("huge docstring", hugeDocstring),
+    ("no defs", noDefs),
+])
@@ -0,0 +1,99 @@
+# Telemetry of the extraction: a JSON line per extracted file with its size,
+# extraction time, throughput and pair counts, and a summary table per
+# repository with the slowest files and the reasons pairs were rejected
+
+import heapq
+import json
+
+kinds = ["comments", "docstrings"]
+
+
+# the telemetry record of a single file, counts are the extraction counts of the file
+def fileRecord(file, size, seconds, counts):
+    pairs = counts.get("normal comments", 0) + counts.get("normal docstrings", 0)
+    rejected = counts.get("rejected comments", 0) + counts.get("rejected docstrings", 0)
+
+    return {"file": file, "bytes": size, "seconds": seconds,
+            "pairs": pairs, "rejected": rejected,
+            "bytesPerSecond": size / max(seconds, 1e-9),
+            "pairsPerSecond": pairs / max(seconds, 1e-9),
+            "reasons": rejectionReasons(counts)}
+
+
+# the number of rejected pairs per "kind: reason" in the extraction counts
+def rejectionReasons(counts):
+    reasons = {}
+    for (key, value) in counts.items():
+        for kind in kinds:
+            prefix = "rejected %s: " % kind
+            if key.startswith(prefix) and value > 0:
+                reasons[kind + ": " + key[len(prefix):]] = value
+
+    return reasons
+
+
+class Report(object):
+    """ Write the telemetry records of the extracted files to a JSON lines
+    file and keep the totals of the current repository for its summary. Only
+    the slowest files are kept in memory. """
+
+    def __init__(self, path, slowest=5):
+        self.path = path
+        self.slowest = slowest
+        self.fp = open(path, 'w')
+        self.reset()
+
+    def reset(self):
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.pairs = 0
+        self.heap = []
+
+    # add the record of a file of the repository
+    def add(self, directory, record):
+        record = dict(record, directory=directory)
+        self.fp.write(json.dumps(record, sort_keys=True) + "\n")
+
+        self.files += 1
+        self.bytes += record["bytes"]
+        self.seconds += record["seconds"]
+        self.pairs += record["pairs"]
+
+        item = (record["seconds"], record["file"], record["bytes"])
+        if len(self.heap) < self.slowest:
+            heapq.heappush(self.heap, item)
+        else:
+            heapq.heappushpop(self.heap, item)
+
+    # the summary table of the repository, counts are its extraction counts
+    def summary(self, directory, counts):
+        lines = []
+        lines.append("Telemetry of %s: %d files, %d bytes, %.3fs" % (directory, self.files, self.bytes, self.seconds))
+        lines.append("Throughput: %.0f bytes/sec, %.0f pairs/sec" %
+                     (self.bytes / max(self.seconds, 1e-9), self.pairs / max(self.seconds, 1e-9)))
+
+        lines.append("Slowest files:")
+        for (seconds, file, size) in sorted(self.heap, reverse=True):
+            lines.append("%10.4fs %12.0f bytes/sec  %s" % (seconds, size / max(seconds, 1e-9), file))
+
+        lines.append("Rejection reasons:")
+        reasons = rejectionReasons(counts)
+        for reason in sorted(reasons, key=lambda reason: (-reasons[reason], reason)):
+            lines.append("%10d  %s" % (reasons[reason], reason))
+
+        # the summary is also kept in the JSON lines file
+        self.fp.write(json.dumps({"directory": directory, "summary": True, "files": self.files,
+                                  "bytes": self.bytes, "seconds": self.seconds, "pairs": self.pairs,
+                                  "reasons": reasons}, sort_keys=True) + "\n")
+        self.reset()
+        return lines
+
+    def close(self):
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
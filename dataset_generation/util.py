@@ -1,14 +1,31 @@
+import imp
+import os
 import re 
 
-# tokenize a sentence by splitting at punctuation marks
+# the tokenizer is shared with the data preparation of the seq2seq model. It is
+# loaded from its file under its own name, so another module called tokenizer on
+# sys.path (for example the PyPI package) can't take its place.
+tokenizer = imp.load_source("seq2seq_tokenizer",
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "seq2seq", "tokenizer.py"))
+
+# tokenize a sentence by splitting at whitespace and punctuation marks, returns the number of tokens
 def tokenize(sentence):
-    _WORD_SPLIT = re.compile(b"([.,!?\"':;)(])")
-    words = []
+    return tokenizer.token_count(sentence)
+
+# check if the code lines and the comment of a pair are smaller than the maxBucket size
+def fitsBucket(code, comment, maxBucket):
+    return tokenizer.token_count("".join(code)) < maxBucket[0] and tokenizer.token_count(comment) < maxBucket[1]
+
+# the reason a pair of code lines and comment is rejected, or None if it is kept
+def rejectReason(code, comment, maxBucket, exceptions):
+    # no need to save code-comment pairs larger than maxBucket size
+    if not fitsBucket(code, comment, maxBucket):
+        return "bucket size"
 
-    for space_separated_fragment in sentence.strip().split():
-        words.extend(re.split(_WORD_SPLIT, space_separated_fragment))
+    if any(exc in comment.lower() for exc in exceptions):
+        return "todo"
 
-    return len([w for w in words if w])
+    return None
 
 # filter anoying repetitive characters in the comment
 def cleanComment(comment):
@@ -1,12 +1,26 @@
 
-# Find filepaths to files containing a string, such as: "# "
-# grep -r -l --include \*.py "# " 
-# grep -r -l --include \*.py '"""' 
-
-import subprocess
+# Extract the comment-code and docstring-code pairs of the repositories in
+# original/ and convert them into a readable format and training files
+
+import argparse
+import collections
+import dedup
+import itertools
+import multiprocessing
+import os
+import shutil
 import sys
+import telemetry
+import time
 import getDocStrings
+import getDocStringsAst
 import getComments
+import extractionCache
+import lineIndex
+import pairs
+import partManifest
+import records
+import sources
 import fileinput
 import re
 
@@ -22,93 +36,362 @@ commentCodeExt = ".commentCode"
 commentExt = ".comment"
 docstringCodeExt = ".dsCode"
 docstringExt = ".ds"
+commentSourceExt = ".commentSrc"
+docstringSourceExt = ".dsSrc"
+commentPairsExt = ".commentPairs"
+docstringPairsExt = ".dsPairs"
+
+# the format of the raw files, "text" writes the code and comments to separate
+# files split by the delimiter and the source file and line of every pair to a
+# third file, "records" writes a single indexed record file per kind (see
+# records.py)
+rawFormat = "text"
+rawFormats = ["text", "records"]
+
+# the raw file extensions of the comment and docstring pairs in each format
+rawExts = {"text": {"comment": [commentCodeExt, commentExt, commentSourceExt],
+                    "docstring": [docstringCodeExt, docstringExt, docstringSourceExt]},
+           "records": {"comment": [commentPairsExt], "docstring": [docstringPairsExt]}}
 
 # the largest bucket, no need to get code-comment pairs larger than this
 maxBucket = [40,50]
 
-# retrieve a file list of files with comments and docstrings in the directory
-def getFileList(directory):
-    try:	
-        # get lists of all files with comments in the directory
-        comments = subprocess.check_output(["grep -r -l --include \*.py '# ' " + directory], shell=True)
-        files_w_comments = comments.splitlines()
-        print "Found %d files with comments" % len(files_w_comments)
-
-        # get a list of all files with doc strings
-        doc_strings = subprocess.check_output(["grep -r -l --include \*.py '\"\"\"' " + directory], shell=True)
-        files_w_doc_strings = doc_strings.splitlines()
-        print "Found %d files with doc strings" % len(files_w_doc_strings)
-    except:
-        print "Unexpected error, most likely no doc strings or comments found. Does the directory exist? \n The error:", sys.exc_info()[0]
+# number of worker processes used for the extraction, 1 extracts in this process
+numWorkers = 1
+
+# amount of files a worker extracts into a single shard
+filesPerShard = 50
+shardExt = ".shard%05d"
+
+# the docstring extractor, "lines" scans the lines of the file and "ast"
+# parses the file and finds the docstrings of the functions in linear time
+docstringExtractor = "lines"
+docstringExtractors = {"lines": getDocStrings, "ast": getDocStringsAst}
+
+# re-use the pairs of files that did not change since the previous run,
+# bump cacheVersion when the extractors change to invalidate the cache
+incremental = False
+cachePath = "processed/cache/"
+cacheVersion = 1
+
+# remove duplicate pairs after the extraction, None keeps all pairs, "exact"
+# removes pairs which only differ in whitespace and "near" also removes pairs
+# with a similarity of at least dedupThreshold (see dedup.py)
+dedupMode = None
+dedupModes = ["exact", "near"]
+dedupThreshold = 0.8
+dedupExt = ".dedup"
+
+# multi-node extraction: the files of every repository are split into parts of
+# filesPerPart files and node i of n extracts the parts whose number in the list
+# of all parts is i modulo n into partsPath. Merging combines the completed
+# parts into the raw files, see partManifest.py
+partsPath = "processed/parts/"
+filesPerPart = 1000
+partExt = ".part%05d"
+
+# write the telemetry of every extracted file (size, time, throughput and the
+# reasons pairs were rejected) to this JSON lines file, None disables it
+telemetryFile = None
+
+# a file is handed to an extractor when its source contains the marker
+commentMarker = "# "
+docstringMarker = '"""'
+
+# open the source provider of a repository in original/, an unpacked
+# directory, a tar or zip archive or a bare git repository (see sources.py)
+def getSource(directory):
+    try:
+        return sources.openSource(originalPath + directory)
+    except (IOError, OSError, ValueError) as e:
+        print "Repository %s can't be read: %s" % (directory, e)
         sys.exit(0)
 
-    return (files_w_comments, files_w_doc_strings)
 
+# retrieve a list of all python files of a source
+def getFileList(source):
+    fileList = source.files()
+    print "Found %d python files" % len(fileList)
+    return fileList
 
-# get the block comment - code pairs
-def getCommentPairs(files_w_comments, directory):
 
-    # set file names and empty files
-    codeFile = processedPath + directory +  commentCodeExt
-    commentFile = processedPath + directory + commentExt
-    open(codeFile, 'w').close()
-    open(commentFile, 'w').close()
+# yield the pairs of a single file, the source is only handed to the
+# extractors when it contains their marker
+def extractFile(file, source, counts):
+    hasComments = commentMarker in source
+    hasDocStrings = docstringMarker in source
 
-    counter = 0
+    # the line scanners share the index of the lines of the file
+    index = None
+    if hasComments or (hasDocStrings and docstringExtractor == "lines"):
+        index = lineIndex.LineIndex(source.splitlines())
 
-    # loop through all files with block comments
-    print "\nBlock comments:"
-    normalComments = 0
-    inlineComments = 0
-    rejectedComments = 0
-    for file in files_w_comments:
-		
-        # print "File " , counter, ":", file
-        counter += 1
-
-        with open(file) as fp:
-            (x, y, z) = getComments.generate_pairs(fp, codeFile, commentFile, maxBucket)
-            normalComments += x
-            inlineComments += y
-            rejectedComments += z
-
-    print "Total comments found: " , normalComments + inlineComments + rejectedComments
-    print "Normal comments: ", normalComments
-    print "Inline comments: ", inlineComments
-    print "Rejected comments: ", rejectedComments
-
-
-# Get the docstring-code pairs
-def getDocStringPairs(files_w_doc_strings, directory):
-    counter = 0
-
-    # set file names and empty files
-    codeFile = processedPath + directory +  docstringCodeExt
-    commentFile = processedPath + directory + docstringExt
-    open(codeFile, 'w').close()
-    open(commentFile, 'w').close()
-
-    # loop through all files with docstrings
-    print "\nDocstrings:"
-    normalDocStrings = 0
-    rejectedDocStrings = 0
-    for file in files_w_doc_strings:
-		
-        # print "File " , counter, ":", file
-        counter += 1
+    if hasComments:
+        counts["files with comments"] += 1
+        for pair in getComments.iter_pairs(index, maxBucket, file, counts):
+            yield pair
+
+    if hasDocStrings:
+        counts["files with docstrings"] += 1
+        if docstringExtractor == "lines":
+            docstringPairs = getDocStrings.iter_pairs(index, maxBucket, file, counts)
+        else:
+            docstringPairs = docstringExtractors[docstringExtractor].iter_pairs(source, maxBucket, file, counts)
+
+        for pair in docstringPairs:
+            yield pair
+
+
+# extract the pairs of a file into a list, when the telemetry is enabled the
+# extraction is timed and the record of the file is added to fileRecords
+def extractTimed(file, text, counts, fileRecords):
+    if telemetryFile is None:
+        return list(extractFile(file, text, counts))
+
+    fileCounts = collections.Counter()
+    start = time.time()
+    filePairs = list(extractFile(file, text, fileCounts))
+    fileRecords.append(telemetry.fileRecord(file, len(text), time.time() - start, fileCounts))
+
+    counts.update(fileCounts)
+    return filePairs
+
+
+# stream all pairs of a directory in original/ without writing any files,
+# so later processing steps can be chained onto the extraction
+def iterPairs(directory, counts=None):
+    if counts is None:
+        counts = collections.Counter()
+
+    source = getSource(directory)
+    for (file, text) in source.iterSources(getFileList(source)):
+        for pair in extractFile(file, text, counts):
+            yield pair
+
+
+# open a writer for the raw files of both kinds of pairs with the given prefix
+def openWriters(prefix):
+    writers = {}
+    for (kind, exts) in rawExts[rawFormat].items():
+        if rawFormat == "records":
+            writers[kind] = pairs.RecordPairWriter(prefix + exts[0])
+        else:
+            writers[kind] = pairs.PairWriter(prefix + exts[0], prefix + exts[1], prefix + exts[2])
+
+    return writers
+
+
+# the raw files written with the given prefix
+def rawFiles(prefix):
+    return [prefix + ext for kind in sorted(rawExts[rawFormat]) for ext in rawExts[rawFormat][kind]]
+
+
+# the raw files with the given prefix together with the indexes of the records
+def rawOutputs(prefix):
+    files = rawFiles(prefix)
+    if rawFormat == "records":
+        files += [file + records.indexExt for file in rawFiles(prefix)]
+
+    return files
+
+
+# open the raw files with the given prefix for appending shards to them
+def openRawFiles(prefix):
+    if rawFormat == "records":
+        return [records.RecordWriter(file) for file in rawFiles(prefix)]
+    else:
+        return [open(file, 'w') for file in rawFiles(prefix)]
+
+
+# append the raw files of a shard to the open output files, and remove them
+# unless remove is False
+def mergeShard(shardPrefix, outFiles, remove=True):
+    for (shardFile, outF) in zip(rawFiles(shardPrefix), outFiles):
+        if rawFormat == "records":
+            with records.RecordReader(shardFile) as reader:
+                for payload in reader.iterRaw():
+                    outF.writeRaw(payload)
+        else:
+            with open(shardFile) as shardF:
+                shutil.copyfileobj(shardF, outF)
+
+    if remove:
+        for file in rawOutputs(shardPrefix):
+            os.remove(file)
+
+
+# extract the pairs of a list of files into the code and comment files with the
+# given prefix, this is also the job a worker process runs for one shard.
+# Every file is read only once, the source is handed to the extractors that
+# are needed for it.
+def extractShard(task):
+    (source, files, prefix) = task
+    counts = collections.Counter()
+    fileRecords = []
+
+    # the writers stay open for the whole shard
+    writers = openWriters(prefix)
+
+    for (file, text) in source.iterSources(files):
+        for pair in extractTimed(file, text, counts, fileRecords):
+            writers[pair.kind].writePair(pair)
+
+    for writer in writers.values():
+        writer.close()
+
+    return (counts, fileRecords)
+
+
+# hand the shards of the files of a source to the pool a few at a time, the
+# shards of an archive carry the content of their files so they should not all
+# be read before the workers get to them. A new shard is handed out as soon as
+# the oldest one is done, the (task, result) pairs are yielded in task order.
+def mapShards(pool, job, tasks):
+    pending = collections.deque()
+    for task in tasks:
+        pending.append((task, pool.apply_async(job, (task,))))
+        if len(pending) >= numWorkers * 2:
+            (task, result) = pending.popleft()
+            yield (task, result.get())
+
+    while pending:
+        (task, result) = pending.popleft()
+        yield (task, result.get())
+
+
+# split the files into shards, let the pool extract them and merge the shards
+# in their original order, so the output is the same as a serial run. The raw
+# files are written to processed/raw unless another prefix is given.
+def extractPairs(source, files, directory, pool=None, report=None, prefix=None):
+    if prefix is None:
+        prefix = processedPath + directory
+    if pool is None:
+        (counts, fileRecords) = extractShard((source, files, prefix))
+        addRecords(report, directory, fileRecords)
+        return counts
+
+    tasks = ((shardSource, shardFiles, prefix + shardExt % index)
+             for (index, (shardSource, shardFiles)) in enumerate(source.shards(files, filesPerShard)))
+
+    outFiles = openRawFiles(prefix)
+
+    # mapShards drains its deque of pending shards in submission order, so the
+    # shards are merged in the order of the tasks
+    counts = collections.Counter()
+    for ((_, _, shardPrefix), result) in mapShards(pool, extractShard, tasks):
+        mergeShard(shardPrefix, outFiles)
+        counts.update(result[0])
+        addRecords(report, directory, result[1])
+
+    for outF in outFiles:
+        outF.close()
+
+    return counts
+
+
+# add the telemetry records of the files of a directory to the report
+def addRecords(report, directory, fileRecords):
+    if report is not None:
+        for record in fileRecords:
+            report.add(directory, record)
+
+
+# the settings the pairs are extracted with, pairs extracted with other
+# settings can't be re-used or combined
+def extractionSettings():
+    return "version=%d maxBucket=%s docstrings=%s" % (cacheVersion, maxBucket, docstringExtractor)
+
+
+# the cache of the extracted pairs for the current settings
+def getCache():
+    return extractionCache.ExtractionCache(cachePath, extractionSettings())
+
+
+# extract the pairs of a shard of files and store them in the cache, this is
+# the job a worker process runs in an incremental run
+def cacheShard(task):
+    (source, files, cache) = task
+    fileRecords = []
+
+    for (file, text) in source.iterSources(files):
+        counts = collections.Counter()
+        filePairs = [(pair.code, pair.comment, pair.lineNo, pair.kind)
+                     for pair in extractTimed(file, text, counts, fileRecords)]
+        cache.store(cache.key(text), filePairs, counts)
+
+    return fileRecords
+
+
+# extract only the files which were added or changed since the previous run
+# and rebuild the raw files of the directory from the cached pairs
+def extractIncremental(source, files, directory, pool=None, report=None):
+    cache = getCache()
+    previous = cache.readManifest(directory)
+
+    # the entry of a file in the previous manifest is reused when its stamp
+    # did not change, the other files are hashed in a single pass
+    manifest = {}
+    changed = []
+    for file in files:
+        entry = previous.get(file)
+        if entry is not None and entry.get("stamp") == source.stamp(file):
+            manifest[file] = entry
+        else:
+            changed.append(file)
+
+    for (file, text) in source.iterSources(changed):
+        manifest[file] = {"key": cache.key(text), "stamp": source.stamp(file)}
+
+    missing = [file for file in files if not cache.has(manifest[file]["key"])]
+
+    tasks = ((shardSource, shardFiles, cache) for (shardSource, shardFiles) in source.shards(missing, filesPerShard))
+    if pool is None:
+        for task in tasks:
+            addRecords(report, directory, cacheShard(task))
+    else:
+        for (_, fileRecords) in mapShards(pool, cacheShard, tasks):
+            addRecords(report, directory, fileRecords)
+
+    # rebuild the raw files in the order of the file list
+    prefix = processedPath + directory
+    writers = openWriters(prefix)
+
+    counts = collections.Counter()
+    for file in files:
+        (filePairs, fileCounts) = cache.load(manifest[file]["key"])
+        counts.update(fileCounts)
+        for (code, comment, lineNo, kind) in filePairs:
+            writers[kind].writePair(pairs.Pair(code, comment, file, lineNo, kind))
+
+    for writer in writers.values():
+        writer.close()
+
+    # drop the pairs of the deleted and changed files
+    keys = set(entry["key"] for entry in manifest.values())
+    deleted = [file for file in previous if file not in manifest]
+    for entry in previous.values():
+        if entry["key"] not in keys:
+            cache.remove(entry["key"])
+
+    cache.writeManifest(directory, manifest)
 
-        with open(file) as fp:
-            (x,y) = getDocStrings.generate_pairs(fp, codeFile, commentFile, maxBucket)
-            normalDocStrings += x
-            rejectedDocStrings += y
+    print "Extracted %d added or changed files, re-used %d files, dropped %d deleted files" % \
+        (len(missing), len(files) - len(missing), len(deleted))
 
-    print "Total docstrings found: " , normalDocStrings + rejectedDocStrings
-    print "Normal docstrings: ", normalDocStrings
-    print "Rejected docstrings: ", rejectedDocStrings
+    return counts
 
 
 # loop through the directory list and extract all comment-code pairs
 def createCCPair():
+    # the files are independent of each other, so they can be extracted in parallel
+    pool = None
+    if numWorkers > 1:
+        pool = multiprocessing.Pool(numWorkers)
+
+    report = None
+    if telemetryFile is not None:
+        report = telemetry.Report(telemetryFile)
+
     for directory in directories:
         print "\n"
         print "-" * 50
@@ -116,76 +399,291 @@ def createCCPair():
         print "-" * 50
 
         # get file list
-        (files_w_comments, files_w_doc_strings) = getFileList(originalPath + directory)
+        source = getSource(directory)
+        files = getFileList(source)
 
-        # extract code-comment pairs
-        getCommentPairs(files_w_comments, directory)
-        getDocStringPairs(files_w_doc_strings, directory)
+        # extract code-comment and docstring-code pairs
+        if incremental:
+            counts = extractIncremental(source, files, directory, pool, report)
+        else:
+            counts = extractPairs(source, files, directory, pool, report)
+        printCounts(counts)
 
+        if report is not None:
+            print ""
+            print "\n".join(report.summary(directory, counts))
 
-# convert the raw newline seperated data into a readable format 
-def createReadableFormat(file, codeF, commentF, counter):
-    with open(file, "a") as file:
-        for directory in directories:
+    if report is not None:
+        report.close()
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+# list the parts of all repositories as (directory, part, parts, source, files,
+# layout) tuples, every node lists the same parts in the same order. The layout
+# records which files of the repository the part covers.
+def listParts():
+    for directory in directories:
+        source = getSource(directory)
+        files = source.files()
+        repositoryFiles = partManifest.fileListHash(files)
+
+        parts = max(1, (len(files) + filesPerPart - 1) // filesPerPart)
+        for part in xrange(parts):
+            partFiles = files[part * filesPerPart:(part + 1) * filesPerPart]
+            layout = {"filesPerPart": filesPerPart, "parts": parts, "files": len(partFiles),
+                      "fileList": partManifest.fileListHash(partFiles), "repositoryFiles": repositoryFiles}
+            yield (directory, part, parts, source, partFiles, layout)
+
+
+# check that a part was extracted from the files the layout describes
+def sameLayout(manifest, layout):
+    return all(manifest.get(key) == value for (key, value) in layout.items())
+
+
+# the layout of the repository a part manifest belongs to, the parts which
+# were split from the same file list in the same way have the same layout
+def partLayout(manifest):
+    return (manifest.get("repositoryFiles"), manifest.get("filesPerPart"), manifest["parts"])
+
+
+# extract the parts of node out of nodes into partsPath, the parts which
+# are already complete are skipped so a crashed node can simply be restarted
+def extractNode(node, nodes):
+    if not os.path.isdir(partsPath):
+        os.makedirs(partsPath)
+
+    pool = None
+    if numWorkers > 1:
+        pool = multiprocessing.Pool(numWorkers)
+
+    report = None
+    if telemetryFile is not None:
+        report = telemetry.Report(telemetryFile)
+
+    settings = extractionSettings()
+    for (index, (directory, part, parts, source, files, layout)) in enumerate(listParts()):
+        if index % nodes != node:
+            continue
+
+        prefix = partsPath + directory + partExt % part
+        manifest = partManifest.read(prefix)
+        if manifest is not None and manifest["settings"] == settings and manifest["format"] == rawFormat and \
+                sameLayout(manifest, layout) and partManifest.verify(manifest, partsPath) == []:
+            print "Part %d of %d of %s is complete" % (part + 1, parts, directory)
+            continue
+
+        # the part is only complete again once its new manifest is written
+        if manifest is not None:
+            partManifest.remove(prefix, manifest, partsPath)
+
+        counts = extractPairs(source, files, directory, pool, report, prefix)
+        info = dict(layout, directory=directory, part=part, settings=settings, format=rawFormat,
+                    counts=dict(counts))
+        partManifest.write(prefix, info, rawOutputs(prefix))
+        print "Extracted part %d of %d of %s, %d files" % (part + 1, parts, directory, len(files))
+
+    if report is not None:
+        report.close()
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+# combine the complete parts in partsPath into the raw files of their
+# repositories, in the order of the directory list and the parts. Parts which
+# are missing, don't match their checksums or were extracted with other
+# settings are left out, as are the parts of a repository with another
+# filesPerPart or file list than most of its parts. The filesPerPart of the
+# parts is taken from their manifests. Returns the list of merged repositories.
+def mergeParts():
+    settings = extractionSettings()
+
+    repositories = collections.defaultdict(dict)
+    for prefix in partManifest.listParts(partsPath):
+        manifest = partManifest.read(prefix)
+        problems = partManifest.verify(manifest, partsPath)
+        if manifest["settings"] != settings or manifest["format"] != rawFormat:
+            problems.append("extracted with other settings")
+
+        if problems:
+            print "Skipping %s: %s" % (prefix, ", ".join(problems))
+            continue
+
+        repositories[manifest["directory"].encode("utf-8")][manifest["part"]] = (prefix, manifest)
+
+    # the parts of a repository extracted from different file lists or with
+    # another filesPerPart don't fit together, only the parts of the most
+    # common layout are merged
+    for (directory, parts) in repositories.items():
+        layouts = collections.Counter(partLayout(manifest) for (_, manifest) in parts.values())
+        layout = max(layouts, key=lambda layout: (layouts[layout], layout))
+        for (part, (prefix, manifest)) in parts.items():
+            if partLayout(manifest) != layout:
+                print "Skipping %s: extracted with another file list or files per part than the other parts of %s" % (prefix, directory)
+                del parts[part]
+
+    merged = [directory for directory in directories if directory in repositories]
+    merged += sorted(directory for directory in repositories if directory not in directories)
+
+    for directory in merged:
+        print "\n"
+        print "-" * 50
+        print "Directory:" , directory
+        print "-" * 50
+
+        parts = repositories[directory]
+        total = parts.values()[0][1]["parts"]
+        missing = [part + 1 for part in xrange(total) if part not in parts]
+        if missing:
+            print "Missing parts %s of %d, merging the other parts" % (", ".join(map(str, missing)), total)
+
+        outFiles = openRawFiles(processedPath + directory)
+        counts = collections.Counter()
+        for part in sorted(parts):
+            (prefix, manifest) = parts[part]
+            mergeShard(prefix, outFiles, remove=False)
+            counts.update(manifest["counts"])
+
+        for outF in outFiles:
+            outF.close()
+
+        print "Merged %d of %d parts" % (len(parts), total)
+        printCounts(counts)
+
+    return merged
 
-            codeFile = processedPath + directory +  codeF
-            commentFile = processedPath + directory + commentF
 
-            # read the lines and do some string / list conversion stuff
-            codeLines =  open(codeFile, "r").readlines()
-            codeLines = "".join(codeLines)
-            codeLines = codeLines.split("!@#$%!@#$%!@#$%!@#$%!@#$%")
-            commentLines = open(commentFile, "r").readlines()
-            commentLines = "".join(commentLines)
-            commentLines = commentLines.split("!@#$%!@#$%!@#$%!@#$%!@#$%")
+# print the statistics of the extraction of a directory
+def printCounts(counts):
+    print "Found %d files with comments" % counts["files with comments"]
+    print "Found %d files with doc strings" % counts["files with docstrings"]
 
+    print "\nBlock comments:"
+    print "Total comments found: " , counts["normal comments"] + counts["inline comments"] + counts["rejected comments"]
+    print "Normal comments: ", counts["normal comments"]
+    print "Inline comments: ", counts["inline comments"]
+    print "Rejected comments: ", counts["rejected comments"]
 
-            # loop through the lines
-            for i in xrange(len(codeLines)):
+    print "\nDocstrings:"
+    print "Total docstrings found: " , counts["normal docstrings"] + counts["rejected docstrings"]
+    print "Normal docstrings: ", counts["normal docstrings"]
+    print "Rejected docstrings: ", counts["rejected docstrings"]
+
+
+# yield the raw pairs of a kind in a directory
+def iterRawPairs(directory, kind):
+    prefix = processedPath + directory
+    exts = rawExts[rawFormat][kind]
+
+    if rawFormat == "records":
+        with pairs.RecordPairReader(prefix + exts[0]) as reader:
+            for pair in reader:
+                yield pair
+        return
+
+    # raw files written before the source files were kept have no source file,
+    # their pairs get an empty source
+    sourceLines = iter([])
+    if os.path.exists(prefix + exts[2]):
+        sourceLines = open(prefix + exts[2], "r")
+
+    # stream the code, comment and source files side by side
+    try:
+        with open(prefix + exts[0], "r") as codeFile:
+            with open(prefix + exts[1], "r") as commentFile:
+                for (code, comment) in itertools.izip(pairs.iterDelimited(codeFile), pairs.iterDelimited(commentFile)):
+
+                    # the files end with a delimiter, every comment ends with a newline
+                    if comment == "":
+                        continue
+
+                    (sourceFile, lineNo) = pairs.parseSource(next(sourceLines, ""))
+                    yield pairs.Pair(code.split("\n")[:-1], comment[:-1], sourceFile, lineNo, kind)
+    finally:
+        if hasattr(sourceLines, "close"):
+            sourceLines.close()
+
+
+# remove the duplicate pairs from the raw files of all directories, a pair is
+# kept only the first time it is seen, in the order of the directories
+def dedupPairs():
+    deduplicator = dedup.Deduplicator(dedupMode, dedupThreshold)
 
-                if "Parameters ----------" in commentLines[i]:
-                    commentLines[i] = commentLines[i].split("Parameters ----------")[0].strip()
+    for directory in directories:
+        prefix = processedPath + directory
+        counts = collections.Counter()
+
+        writers = openWriters(prefix + dedupExt)
+        for kind in sorted(writers):
+            for pair in iterRawPairs(directory, kind):
+                counts["pairs"] += 1
+                duplicate = deduplicator.check("\n".join(pair.code), pair.comment)
+                if duplicate is None:
+                    writers[kind].writePair(pair)
+                else:
+                    counts[duplicate + " duplicates"] += 1
+
+        for writer in writers.values():
+            writer.close()
+
+        # replace the raw files by the deduplicated ones
+        for (dedupFile, rawFile) in zip(rawFiles(prefix + dedupExt), rawFiles(prefix)):
+            os.rename(dedupFile, rawFile)
+            if rawFormat == "records":
+                os.rename(dedupFile + records.indexExt, rawFile + records.indexExt)
+
+        print "%s: dropped %d exact and %d near duplicates of %d pairs" % \
+            (directory, counts["exact duplicates"], counts["near duplicates"], counts["pairs"])
+
+
+# convert the raw data into a readable format 
+def createReadableFormat(file, kind, counter):
+    with open(file, "a") as file:
+        for directory in directories:
 
-                if codeLines[i].strip() != '' and commentLines[i].strip() != '':
+            # loop through the pairs
+            for pair in iterRawPairs(directory, kind):
+                (code, comment) = ("\n".join(pair.code), pair.comment)
+
+                if "Parameters ----------" in comment:
+                    comment = comment.split("Parameters ----------")[0].strip()
+
+                if code.strip() != '' and comment.strip() != '':
                     file.write("Pair : " + str(counter) + "\n")
-                    file.write("Comment:" + commentLines[i].strip() + "\n")
-                    file.write("Code:\n" + codeLines[i].rstrip() + "\n\n")
+                    file.write("Comment:" + comment.strip() + "\n")
+                    file.write("Code:\n" + code.rstrip() + "\n\n")
                     counter += 1
 
     return counter
 
 
-# convert the raw newline seperated data into training files
-def createTrainingFile(eFile, cFile, codeFileExtension, commentFileExtension, counter, directory):
+# convert the raw data into training files, the source file of every pair is
+# written to a third file so a dataset can be split by source file. Pairs of
+# raw files without source files get an empty line.
+def createTrainingFile(eFile, cFile, sFile, kind, counter, directory):
     with open(eFile, "a") as enFile:
         with open(cFile, "a") as codeFile:
+            with open(sFile, "a") as sourceFile:
 
-            # get the processed files in raw format
-            codeFileName = processedPath + directory +  codeFileExtension
-            commentFileName = processedPath + directory + commentFileExtension
+                # loop through the pairs
+                for pair in iterRawPairs(directory, kind):
+                    (code, comment) = ("\n".join(pair.code), pair.comment)
 
-            # read the lines and remove annoying spaces / enters and stuff
-            codeLines =  open(codeFileName, "r").readlines()
-            codeLines = "".join(codeLines)
-            codeLines = " ".join(codeLines.split())
-            codelines = "".join(codeLines)
-            codeLines = codeLines.split("!@#$%!@#$%!@#$%!@#$%!@#$%")
-            commentLines = open(commentFileName, "r").readlines()
-            commentLines = "".join(commentLines)
-            commentLines = commentLines.split("!@#$%!@#$%!@#$%!@#$%!@#$%")
+                    # remove annoying spaces / enters and stuff
+                    code = " ".join(code.split())
 
-            # loop through the lines
-            for i in xrange(len(codeLines)):
+                    if "Parameters ----------" in comment:
+                        comment = comment.split("Parameters ----------")[0].strip()
 
-                # any(x in a for x in b)
-
-                if "Parameters ----------" in commentLines[i]:
-                    commentLines[i] = commentLines[i].split("Parameters ----------")[0].strip()
-
-                if codeLines[i].strip() != '' and commentLines[i].strip() != '':
-                    codeFile.write(codeLines[i].strip().replace("\n","") + "\n")
-                    enFile.write(commentLines[i].strip().replace("\n","") + "\n")
-                    counter += 1
+                    if code != '' and comment.strip() != '':
+                        codeFile.write(code + "\n")
+                        enFile.write(comment.strip().replace("\n","") + "\n")
+                        sourceFile.write(pair.sourceFile + "\n")
+                        counter += 1
 
     return counter
 
@@ -193,51 +691,103 @@ def createSeperateTrainingFiles():
     for directory in directories:
         enFile = trainingFile + directory + ".en"
         codeFile = trainingFile + directory + ".code"
+        sourceFile = trainingFile + directory + ".src"
 
         # empty files
         open(enFile, 'w').close()
         open(codeFile, 'w').close()
+        open(sourceFile, 'w').close()
 
         counter = 0 
         # convert the docstring-code pairs and comment-code pairs into two large files 
-        counter = createTrainingFile(enFile, codeFile, commentCodeExt, commentExt, 1, directory)
-        createTrainingFile(enFile, codeFile, docstringCodeExt, docstringExt, counter, directory)
+        counter = createTrainingFile(enFile, codeFile, sourceFile, "comment", 1, directory)
+        createTrainingFile(enFile, codeFile, sourceFile, "docstring", counter, directory)
 
 
 def concatenateTrainingFiles():
-    enFileAll = trainingFile + "all.en"
-    codeFileAll = trainingFile + "all.code"
-
     # Conctatenate all seperate trainingsfile into a single file
-    with open(enFileAll, 'w') as enFileAll:
-        with open(codeFileAll, 'w') as codeFileAll:
+    for extension in [".en", ".code", ".src"]:
+        with open(trainingFile + "all" + extension, 'w') as allFile:
             for directory in directories:
-                # get seperate training files of this directory
-                enFile = trainingFile + directory + ".en"
-                codeFile = trainingFile + directory + ".code"
-
-                # write the comments to the comment file
-                with open(enFile) as enFile:
-                    for line in enFile:
-                        enFileAll.write(line)
-
-                # write the code to the code file
-                with open(codeFile) as codeFile:
-                    for line in codeFile: 
-                        codeFileAll.write(line)
-
+                # get seperate training file of this directory
+                with open(trainingFile + directory + extension) as file:
+                    shutil.copyfileobj(file, allFile, pairs.bufferSize)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Extract code-comment pairs and convert them into training files.")
+    parser.add_argument("--directories", nargs="+", default=directories, metavar="REPOSITORY",
+                        help="repositories in %s to extract, unpacked directories, .tar(.gz) or .zip "
+                             "archives or bare git repositories with an optional @revision" % originalPath)
+    parser.add_argument("--workers", type=int, default=numWorkers,
+                        help="number of worker processes used to extract the pairs (default %(default)s)")
+    parser.add_argument("--docstrings", choices=sorted(docstringExtractors), default=docstringExtractor,
+                        help="extractor used for the docstring-code pairs (default %(default)s)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only extract the files which changed since the previous run, see cachePath")
+    parser.add_argument("--format", choices=rawFormats, default=rawFormat,
+                        help="format of the raw files (default %(default)s)")
+    parser.add_argument("--node", metavar="I/N",
+                        help="only extract the parts of node I of N (counting from 0) into %s and stop" % partsPath)
+    parser.add_argument("--files-per-part", type=int, default=filesPerPart,
+                        help="files in a part of a repository, the same on every node, --merge takes it from the "
+                             "parts (default %(default)s)")
+    parser.add_argument("--merge", action="store_true",
+                        help="merge the complete parts in %s instead of extracting the repositories" % partsPath)
+    parser.add_argument("--telemetry", metavar="FILE", default=telemetryFile,
+                        help="write the extraction time and rejection reasons of every file to this JSON lines file")
+    parser.add_argument("--dedup", choices=dedupModes, default=dedupMode,
+                        help="remove exact or near duplicate pairs after the extraction")
+    parser.add_argument("--dedup-threshold", type=float, default=dedupThreshold,
+                        help="similarity from which pairs are near duplicates (default %(default)s)")
+    args = parser.parse_args()
+    directories = args.directories
+    numWorkers = args.workers
+    docstringExtractor = args.docstrings
+    incremental = args.incremental
+    rawFormat = args.format
+    dedupMode = args.dedup
+    telemetryFile = args.telemetry
+    dedupThreshold = args.dedup_threshold
+    filesPerPart = args.files_per_part
+
+    if args.node is not None:
+        try:
+            (node, nodes) = map(int, args.node.split("/"))
+        except ValueError:
+            parser.error("--node should be I/N, for example 0/4")
+        if not 0 <= node < nodes:
+            parser.error("--node %s: I should be at least 0 and smaller than N" % args.node)
+
+        print "Extracting the parts of node %d of %d.." % (node, nodes)
+        extractNode(node, nodes)
+        sys.exit(0)
 
-if __name__ == '__main__':    
-    print "Creating Code-Comment pairs.."
-    createCCPair()
+    if args.merge:
+        print "Merging the extracted parts.."
+        directories = mergeParts()
+
+        # keep the training files of an earlier run instead of replacing them
+        # with empty ones
+        if directories == []:
+            print "No complete parts found in %s, nothing merged" % partsPath
+            sys.exit(1)
+    else:
+        print "Creating Code-Comment pairs.."
+        createCCPair()
     print "-" * 50
+
+    if dedupMode is not None:
+        print "Removing %s duplicate pairs.." % dedupMode
+        dedupPairs()
+        print "-" * 50
  
     print "Converting into readable format.."
     # empty file
     file = readableFile + "readable.txt"
     open(file, 'w').close()
-    counter = createReadableFormat(file, commentCodeExt, commentExt, 1)
-    createReadableFormat(file, docstringCodeExt, docstringExt, counter)
+    counter = createReadableFormat(file, "comment", 1)
+    createReadableFormat(file, "docstring", counter)
 
     print "Converting into seperate training files.."
     createSeperateTrainingFiles()
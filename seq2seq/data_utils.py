@@ -18,15 +18,27 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import collections
 import gzip
+import heapq
+import marshal
+import multiprocessing
+import multiprocessing.pool
 import os
 import sys
 import re
+import shutil
 import tarfile
+import tempfile
 import StringIO
 import tokenize
 import utils.analyze as structurer
 
+import manifest
+import numpy as np
+
+from tokenizer import basic_tokenizer, tokenize_lines
+
 from six.moves import urllib
 
 from tensorflow.python.platform import gfile
@@ -43,18 +55,47 @@ GO_ID = 1
 EOS_ID = 2
 UNK_ID = 3
 
-# Regular expressions used to tokenize.
-_WORD_SPLIT = re.compile(b"([`.,!?\"':;)(])")
+# Regular expressions used to tokenize, basic_tokenizer is shared with the
+# dataset generation in tokenizer.py.
 _DIGIT_RE = re.compile(br"\d")
 
+# Number of lines tokenized in a single batch by the basic tokenizer.
+_TOKENIZE_BATCH = 10000
+
+# Extensions of the binary token-id files written by data_to_token_ids: the
+# token ids of all lines as one flat int32 array, and the int64 offsets of
+# the lines in it (one more than the number of lines).
+_TOKENS_EXT = ".tokens"
+_OFFSETS_EXT = ".offsets"
+_TOKENS_DTYPE = np.dtype("<i4")
+_OFFSETS_DTYPE = np.dtype("<i8")
+
+# Number of lines of token ids buffered before they are written.
+_WRITE_BATCH = 10000
+
+# Number of spilled count files of create_vocabulary which are merged at once.
+_MAX_OPEN_SPILLS = 64
 
 
-def basic_tokenizer(sentence):
-    """Very basic tokenizer: split the sentence into a list of tokens."""
-    words = []
-    for space_separated_fragment in sentence.strip().split():
-        words.extend(re.split(_WORD_SPLIT, space_separated_fragment))
-    return [w for w in words if w]
+def _tokenized_lines(f, tokenizer, normalize_digits):
+  """Yield the tokens of every line of f, tokenized in batches by default."""
+  if tokenizer:
+    for line in f:
+      tokens = tokenizer(line)
+      if normalize_digits:
+        tokens = [re.sub(_DIGIT_RE, b"0", w) for w in tokens]
+      yield tokens
+    return
+
+  batch = []
+  for line in f:
+    batch.append(line)
+    if len(batch) == _TOKENIZE_BATCH:
+      for tokens in tokenize_lines(batch, normalize_digits):
+        yield tokens
+      batch = []
+  for tokens in tokenize_lines(batch, normalize_digits):
+    yield tokens
 
 
 # def python_tokenizer(sentence):
@@ -88,13 +129,184 @@ def basic_tokenizer(sentence):
     # return new_token_list
 
 
+def _lines_until(f, end):
+  """Yield the lines of f from the current position which start before end."""
+  while f.tell() < end:
+    line = f.readline()
+    if not line:
+      return
+    yield line
+
+
+def _count_chunk(chunk):
+  """Count the tokens of the lines of a file starting in a byte range.
+
+  This is the job of a worker process of create_vocabulary. A line belongs to
+  the chunk in which it starts, so every line is counted exactly once.
+
+  Args:
+    chunk: a tuple (data_path, start, end, tokenizer, normalize_digits).
+
+  Returns:
+    a dictionary with the count of every token.
+  """
+  data_path, start, end, tokenizer, normalize_digits = chunk
+  counts = {}
+  with open(data_path, "rb") as f:
+    # skip the line which started in the previous chunk
+    if start > 0:
+      f.seek(start - 1)
+      f.readline()
+    for tokens in _tokenized_lines(_lines_until(f, end), tokenizer,
+                                   normalize_digits):
+      for w in tokens:
+        if w in counts:
+          counts[w] += 1
+        else:
+          counts[w] = 1
+  return counts
+
+
+def _count_parallel(data_path, tokenizer, normalize_digits, num_workers):
+  """Count the tokens of a local file in byte-range chunks in num_workers
+  processes and merge the counts.
+
+  The counts are exact and ties are broken by token, so the vocabulary is
+  identical to the one of a serial count.
+  """
+  size = os.path.getsize(data_path)
+  num_chunks = num_workers * 4
+  bounds = [size * i // num_chunks for i in xrange(num_chunks + 1)]
+  chunks = [(data_path, bounds[i], bounds[i + 1], tokenizer, normalize_digits)
+            for i in xrange(num_chunks) if bounds[i] < bounds[i + 1]]
+
+  pool = multiprocessing.Pool(num_workers)
+  try:
+    vocab = {}
+    for i, counts in enumerate(pool.imap(_count_chunk, chunks)):
+      print("  counted chunk %d of %d" % (i + 1, len(chunks)))
+      for w, count in counts.iteritems():
+        if w in vocab:
+          vocab[w] += count
+        else:
+          vocab[w] = count
+  finally:
+    pool.close()
+    pool.join()
+  return vocab
+
+
+def _spill_counts(counts, spill_dir):
+  """Write token counts sorted by token to a new file in spill_dir.
+
+  Every entry is a marshalled tuple (token, count).
+  """
+  fd, path = tempfile.mkstemp(suffix=".counts", dir=spill_dir)
+  with os.fdopen(fd, "wb") as spill:
+    for w in sorted(counts):
+      marshal.dump((w, counts[w]), spill)
+  return path
+
+
+def _read_spill(path):
+  """Yield the (token, count) tuples of a spilled count file."""
+  with open(path, "rb") as spill:
+    while True:
+      try:
+        yield marshal.load(spill)
+      except EOFError:
+        return
+
+
+def _merged_counts(paths):
+  """Yield the summed (token, count) tuples of spilled count files, sorted
+  by token."""
+  current = None
+  for w, count in heapq.merge(*[_read_spill(p) for p in paths]):
+    if w == current:
+      total += count
+    else:
+      if current is not None:
+        yield current, total
+      current, total = w, count
+  if current is not None:
+    yield current, total
+
+
+def _merge_spills(paths, spill_dir):
+  """Merge spilled count files into a single new one and remove them."""
+  fd, path = tempfile.mkstemp(suffix=".counts", dir=spill_dir)
+  with os.fdopen(fd, "wb") as spill:
+    for entry in _merged_counts(paths):
+      marshal.dump(entry, spill)
+  for p in paths:
+    os.remove(p)
+  return path
+
+
+def _top_tokens_bounded(f, tokenizer, normalize_digits, max_tokens_in_memory,
+                        size):
+  """The size most frequent tokens of f, counted in bounded memory.
+
+  At most max_tokens_in_memory distinct tokens are counted in memory; when
+  a new token does not fit, the counts are spilled to a temporary file
+  sorted by token. The spilled counts are merged and summed in a single
+  sorted pass and the most frequent tokens are selected with a heap, so the
+  counts are exact and memory is bounded by the budget and size instead of
+  by the number of distinct tokens.
+
+  Args:
+    f: the data file, one sentence per line.
+    tokenizer: a function to use to tokenize each data sentence;
+      if None, basic_tokenizer will be used.
+    normalize_digits: Boolean; if true, all digits are replaced by 0s.
+    max_tokens_in_memory: maximum number of distinct tokens counted in memory.
+    size: number of tokens to return.
+
+  Returns:
+    the size most frequent tokens, most frequent first; tokens with the same
+    count are sorted by token, as in create_vocabulary.
+  """
+  spill_dir = tempfile.mkdtemp(prefix="vocab")
+  try:
+    paths = []
+    counts = {}
+    counter = 0
+    for tokens in _tokenized_lines(f, tokenizer, normalize_digits):
+      counter += 1
+      if counter % 100000 == 0:
+        print("  processing line %d" % counter)
+      for w in tokens:
+        if w in counts:
+          counts[w] += 1
+        else:
+          if len(counts) >= max_tokens_in_memory:
+            paths.append(_spill_counts(counts, spill_dir))
+            counts = {}
+            if len(paths) == _MAX_OPEN_SPILLS:
+              paths = [_merge_spills(paths, spill_dir)]
+          counts[w] = 1
+    if counts:
+      paths.append(_spill_counts(counts, spill_dir))
+    counts = None
+    print("  merging %d spilled count files" % len(paths))
+
+    top = heapq.nsmallest(size, ((-count, w) for w, count
+                                 in _merged_counts(paths)))
+    return [w for _, w in top]
+  finally:
+    shutil.rmtree(spill_dir)
+
+
 def create_vocabulary(vocabulary_path, data_path, max_vocabulary_size,
-                      tokenizer=None, normalize_digits=True):
-  """Create vocabulary file (if it does not exist yet) from data file.
+                      tokenizer=None, normalize_digits=True, num_workers=1,
+                      max_tokens_in_memory=None):
+  """Create vocabulary file (if it is missing or stale) from data file.
 
   Data file is assumed to contain one sentence per line. Each sentence is
   tokenized and digits are normalized (if normalize_digits is set).
-  Vocabulary contains the most-frequent tokens up to max_vocabulary_size.
+  Vocabulary contains the most-frequent tokens up to max_vocabulary_size,
+  tokens with the same count are sorted by token.
   We write it to vocabulary_path in a one-token-per-line format, so that later
   token in the first line gets id=0, second line gets id=1, and so on.
 
@@ -105,29 +317,58 @@ def create_vocabulary(vocabulary_path, data_path, max_vocabulary_size,
     tokenizer: a function to use to tokenize each data sentence;
       if None, basic_tokenizer will be used.
     normalize_digits: Boolean; if true, all digits are replaced by 0s.
+    num_workers: number of processes which tokenize and count byte-range
+      chunks of a local data file in parallel; the vocabulary is the same
+      as with a single process. The tokenizer has to be picklable.
+    max_tokens_in_memory: if set, count at most this many distinct tokens in
+      memory and spill the counts to temporary files beyond it, in a single
+      process; the vocabulary is the same as without a limit.
+
+  The vocabulary is made again when the content of the data file, the
+  size, the tokenizer or normalize_digits changed since it was made, as
+  recorded in its manifest.
   """
-  if not gfile.Exists(vocabulary_path):
+  vocabulary_manifest = manifest.create(
+      {"data": data_path},
+      {"max_vocabulary_size": max_vocabulary_size,
+       "tokenizer": tokenizer_fingerprint(tokenizer),
+       "normalize_digits": normalize_digits})
+  if not manifest.is_up_to_date([vocabulary_path], vocabulary_manifest):
+    manifest.remove(vocabulary_path)
     print("Creating vocabulary %s from data %s" % (vocabulary_path, data_path))
-    vocab = {}
-    with gfile.GFile(data_path, mode="rb") as f:
-      counter = 0
-      for line in f:
-        counter += 1
-        if counter % 100000 == 0:
-          print("  processing line %d" % counter)
-        tokens = tokenizer(line) if tokenizer else basic_tokenizer(line)
-        for w in tokens:
-          word = re.sub(_DIGIT_RE, b"0", w) if normalize_digits else w
-          if word in vocab:
-            vocab[word] += 1
-          else:
-            vocab[word] = 1
-      vocab_list = _START_VOCAB + sorted(vocab, key=vocab.get, reverse=True)
-      if len(vocab_list) > max_vocabulary_size:
-        vocab_list = vocab_list[:max_vocabulary_size]
-      with gfile.GFile(vocabulary_path, mode="wb") as vocab_file:
-        for w in vocab_list:
-          vocab_file.write(w + b"\n")
+    size = max(max_vocabulary_size - len(_START_VOCAB), 0)
+    if max_tokens_in_memory:
+      with gfile.GFile(data_path, mode="rb") as f:
+        vocab_list = _START_VOCAB + _top_tokens_bounded(
+            f, tokenizer, normalize_digits, max_tokens_in_memory, size)
+    else:
+      if num_workers > 1 and os.path.isfile(data_path):
+        vocab = _count_parallel(data_path, tokenizer, normalize_digits,
+                                num_workers)
+      else:
+        vocab = {}
+        with gfile.GFile(data_path, mode="rb") as f:
+          counter = 0
+          for tokens in _tokenized_lines(f, tokenizer, normalize_digits):
+            counter += 1
+            if counter % 100000 == 0:
+              print("  processing line %d" % counter)
+            for word in tokens:
+              if word in vocab:
+                vocab[word] += 1
+              else:
+                vocab[word] = 1
+      # the same as sorting the whole vocabulary by count and token and
+      # keeping the first size, so the tokens of a tied count are cut the
+      # same way by every path
+      vocab_list = _START_VOCAB + [w for _, w in heapq.nsmallest(
+          size, ((-count, w) for w, count in vocab.iteritems()))]
+    if len(vocab_list) > max_vocabulary_size:
+      vocab_list = vocab_list[:max_vocabulary_size]
+    with gfile.GFile(vocabulary_path, mode="wb") as vocab_file:
+      for w in vocab_list:
+        vocab_file.write(w + b"\n")
+    manifest.write(vocabulary_path, vocabulary_manifest)
 
 
 def initialize_vocabulary(vocabulary_path):
@@ -160,6 +401,26 @@ def initialize_vocabulary(vocabulary_path):
     raise ValueError("Vocabulary file %s not found.", vocabulary_path)
 
 
+def tokenizer_fingerprint(tokenizer):
+  """A description of a tokenizer for the manifests, which changes when the
+  tokens it makes change.
+
+  Args:
+    tokenizer: a tokenizer function or object, or None for basic_tokenizer.
+      An object can describe itself with a fingerprint() method, else its
+      module and name are used.
+
+  Returns:
+    a string.
+  """
+  if tokenizer is None:
+    return "basic_tokenizer"
+  if hasattr(tokenizer, "fingerprint"):
+    return tokenizer.fingerprint()
+  name = getattr(tokenizer, "__name__", type(tokenizer).__name__)
+  return "%s.%s" % (getattr(tokenizer, "__module__", ""), name)
+
+
 def sentence_to_token_ids(sentence, vocabulary,
                           tokenizer=None, normalize_digits=True):
   """Convert a string to list of integers representing token-ids.
@@ -189,8 +450,179 @@ def sentence_to_token_ids(sentence, vocabulary,
   return [vocabulary.get(re.sub(_DIGIT_RE, b"0", w), UNK_ID) for w in words]
 
 
+class LRUCache(object):
+  """A dictionary of at most size entries, which drops the least recently
+  used entry when it is full and counts the hits and misses of get.
+
+  Args:
+    size: the maximum number of entries; with 0 nothing is kept.
+  """
+
+  def __init__(self, size):
+    self.size = size
+    self.hits = 0
+    self.misses = 0
+    self._entries = collections.OrderedDict()
+
+  def get(self, key, default=None):
+    """The value of key, which becomes the most recently used entry."""
+    try:
+      value = self._entries.pop(key)
+    except KeyError:
+      self.misses += 1
+      return default
+    self._entries[key] = value
+    self.hits += 1
+    return value
+
+  def put(self, key, value):
+    """Add or replace the value of key."""
+    if self.size <= 0:
+      return
+    self._entries.pop(key, None)
+    if len(self._entries) >= self.size:
+      self._entries.popitem(last=False)
+    self._entries[key] = value
+
+  def __len__(self):
+    return len(self._entries)
+
+  def stats(self):
+    """A line with the hits and misses of the cache."""
+    lookups = self.hits + self.misses
+    return ("%d hits, %d misses (%.1f%% hit rate), %d of %d entries" %
+            (self.hits, self.misses, 100.0 * self.hits / max(lookups, 1),
+             len(self), self.size))
+
+
+class SentenceEncoder(object):
+  """Turn batches of sentences into token-ids with a vocabulary loaded once.
+
+  The same token-ids as sentence_to_token_ids, but the sentences of a batch
+  are tokenized and their digits normalized in one call, and the tokens are
+  looked up with the bound get of the vocabulary.
+
+  Args:
+    vocabulary: the path to a vocabulary file or a dictionary mapping tokens
+      to integers.
+    tokenizer: a function to use to tokenize each sentence;
+      if None, basic_tokenizer will be used.
+    normalize_digits: Boolean; if true, all digits are replaced by 0s.
+    cache_size: the number of encoded sentences kept in an LRUCache, so
+      repeated sentences are not tokenized again; 0 for no cache.
+  """
+
+  def __init__(self, vocabulary, tokenizer=None, normalize_digits=True,
+               cache_size=0):
+    if isinstance(vocabulary, basestring):
+      vocabulary, _ = initialize_vocabulary(vocabulary)
+    self.vocabulary = vocabulary
+    self.tokenizer = tokenizer
+    self.normalize_digits = normalize_digits
+    self.cache = LRUCache(cache_size) if cache_size > 0 else None
+
+  def encode(self, sentences):
+    """Convert a list of sentences in bytes format to lists of token-ids."""
+    if self.cache is None:
+      return self._encode(sentences)
+
+    # only the distinct sentences which are not in the cache are encoded, a
+    # copy of a missing sentence in the same batch is counted as a hit
+    cached = [None] * len(sentences)
+    missing = collections.OrderedDict()
+    for i, s in enumerate(sentences):
+      if s in missing:
+        missing[s].append(i)
+        self.cache.hits += 1
+        continue
+      cached[i] = self.cache.get(s)
+      if cached[i] is None:
+        missing[s] = [i]
+    if missing:
+      for s, ids in zip(missing, self._encode(list(missing))):
+        ids = tuple(ids)
+        self.cache.put(s, ids)
+        for i in missing[s]:
+          cached[i] = ids
+    return [list(ids) for ids in cached]
+
+  def _encode(self, sentences):
+    # a sentence is a single line of the batch
+    lines = [s.rstrip(b"\n").replace(b"\n", b" ") for s in sentences]
+    get = self.vocabulary.get
+    return [[get(w, UNK_ID) for w in words]
+            for words in _tokenized_lines(lines, self.tokenizer, self.normalize_digits)]
+
+  def iter_encode(self, sentences, batch_size=_TOKENIZE_BATCH):
+    """Yield the token-ids of every sentence of an iterable, for example a
+    file, encoding batch_size sentences at a time."""
+    for batch in _batches(sentences, batch_size):
+      for token_ids in self.encode(batch):
+        yield token_ids
+
+
+def _batches(f, size):
+  """Yield the lines of f in lists of at most size lines."""
+  batch = []
+  for line in f:
+    batch.append(line)
+    if len(batch) == size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
+def _ordered_map(pool, func, tasks, window):
+  """Like pool.imap, but with at most window tasks read from tasks and not
+  yet consumed, so a large input is not read into memory ahead of the
+  workers. The results are yielded in the order of the tasks."""
+  pending = collections.deque()
+  for task in tasks:
+    pending.append(pool.apply_async(func, (task,)))
+    if len(pending) >= window:
+      yield pending.popleft().get()
+  while pending:
+    yield pending.popleft().get()
+
+
+# The vocabularies loaded by a worker process of data_to_token_ids, by path
+# and content hash.
+_worker_vocabularies = {}
+
+
+def _token_ids_chunk(chunk):
+  """Turn a block of lines into token-ids in a worker process.
+
+  Args:
+    chunk: a tuple (vocabulary_path, vocabulary_hash, tokenizer,
+      normalize_digits, lines).
+
+  Returns:
+    the list of token-ids of every line.
+  """
+  vocabulary_path, vocabulary_hash, tokenizer, normalize_digits, lines = chunk
+  key = (vocabulary_path, vocabulary_hash)
+  if key not in _worker_vocabularies:
+    _worker_vocabularies[key] = initialize_vocabulary(vocabulary_path)[0]
+  vocab = _worker_vocabularies[key]
+  return [[vocab.get(w, UNK_ID) for w in words]
+          for words in _tokenized_lines(lines, tokenizer, normalize_digits)]
+
+
+def _counted(token_ids):
+  """Pass the token-ids of the lines through and report the progress."""
+  counter = 0
+  for ids in token_ids:
+    counter += 1
+    if counter % 100000 == 0:
+      print("  tokenizing line %d" % counter)
+    yield ids
+
+
 def data_to_token_ids(data_path, target_path, vocabulary_path,
-                      tokenizer=None, normalize_digits=True):
+                      tokenizer=None, normalize_digits=True, binary=False,
+                      num_workers=1, pool=None):
   """Tokenize data file and turn into token-ids using given vocabulary file.
 
   This function loads data line-by-line from data_path, calls the above
@@ -204,31 +636,147 @@ def data_to_token_ids(data_path, target_path, vocabulary_path,
     tokenizer: a function to use to tokenize each sentence;
       if None, basic_tokenizer will be used.
     normalize_digits: Boolean; if true, all digits are replaced by 0s.
+    binary: Boolean; if true, the token-ids are written to the binary files
+      of target_path (see token_ids_files) instead of a text file.
+    num_workers: number of processes which turn blocks of lines into
+      token-ids in parallel; the blocks are written in their original order,
+      so the output is the same as with a single process. The tokenizer has
+      to be picklable.
+    pool: an existing multiprocessing pool with num_workers processes to
+      use, for example one shared by several conversions.
+
+  The token-ids are made again when the content of the data file or the
+  vocabulary, the tokenizer or normalize_digits changed since they were
+  made, as recorded in their manifest.
   """
-  if not gfile.Exists(target_path):
+  outputs = list(token_ids_files(target_path)) if binary else [target_path]
+  ids_manifest = manifest.create(
+      {"data": data_path, "vocabulary": vocabulary_path},
+      {"tokenizer": tokenizer_fingerprint(tokenizer),
+       "normalize_digits": normalize_digits,
+       "binary": binary})
+  if not manifest.is_up_to_date(outputs, ids_manifest):
+    manifest.remove(outputs[0])
     print("Tokenizing data in %s" % data_path)
-    vocab, _ = initialize_vocabulary(vocabulary_path)
-    with gfile.GFile(data_path, mode="rb") as data_file:
-      with gfile.GFile(target_path, mode="w") as tokens_file:
-        counter = 0
-        for line in data_file:
-          counter += 1
-          if counter % 100000 == 0:
-            print("  tokenizing line %d" % counter)
-          token_ids = sentence_to_token_ids(line, vocab, tokenizer,
-                                            normalize_digits)
-          tokens_file.write(" ".join([str(tok) for tok in token_ids]) + "\n")
-
-
-def prepare_data(data_dir, code_vocabulary_size, en_vocabulary_size, tokenizer=None):
+    own_pool = pool is None and num_workers > 1
+    if own_pool:
+      pool = multiprocessing.Pool(num_workers)
+    try:
+      with gfile.GFile(data_path, mode="rb") as data_file:
+        if pool is not None:
+          vocabulary_hash = manifest.file_hash(vocabulary_path)
+          chunks = ((vocabulary_path, vocabulary_hash, tokenizer, normalize_digits, lines)
+                    for lines in _batches(data_file, _TOKENIZE_BATCH))
+          token_ids = (ids for block in _ordered_map(pool, _token_ids_chunk, chunks,
+                                                     2 * max(num_workers, 1))
+                       for ids in block)
+        else:
+          vocab, _ = initialize_vocabulary(vocabulary_path)
+          token_ids = ([vocab.get(w, UNK_ID) for w in words]
+                       for words in _tokenized_lines(data_file, tokenizer,
+                                                     normalize_digits))
+        if binary:
+          _write_binary_token_ids(_counted(token_ids), target_path)
+        else:
+          with gfile.GFile(target_path, mode="w") as tokens_file:
+            for ids in _counted(token_ids):
+              tokens_file.write(" ".join([str(tok) for tok in ids]) + "\n")
+    finally:
+      if own_pool:
+        pool.close()
+        pool.join()
+    manifest.write(outputs[0], ids_manifest)
+
+
+def token_ids_files(target_path):
+  """The paths of the binary token-id files of target_path."""
+  return target_path + _TOKENS_EXT, target_path + _OFFSETS_EXT
+
+
+def _write_binary_token_ids(token_ids, target_path):
+  """Write the token-ids of the lines to the binary files of target_path.
+  The files are written under a temporary name and renamed when complete, so
+  an interrupted run leaves no partial files behind."""
+  tokens_path, offsets_path = token_ids_files(target_path)
+  with open(tokens_path + ".tmp", "wb") as tokens_file:
+    with open(offsets_path + ".tmp", "wb") as offsets_file:
+      counter = 0
+      position = 0
+      buffered = []
+      offsets = [0]
+      for ids in token_ids:
+        counter += 1
+        buffered.extend(ids)
+        offsets.append(position + len(buffered))
+        if counter % _WRITE_BATCH == 0:
+          np.asarray(buffered, dtype=_TOKENS_DTYPE).tofile(tokens_file)
+          np.asarray(offsets, dtype=_OFFSETS_DTYPE).tofile(offsets_file)
+          position += len(buffered)
+          buffered = []
+          offsets = []
+      np.asarray(buffered, dtype=_TOKENS_DTYPE).tofile(tokens_file)
+      np.asarray(offsets, dtype=_OFFSETS_DTYPE).tofile(offsets_file)
+  os.rename(tokens_path + ".tmp", tokens_path)
+  os.rename(offsets_path + ".tmp", offsets_path)
+
+
+def _memmap(path, dtype):
+  """Map a binary file read-only; numpy can't map an empty file."""
+  if os.path.getsize(path) == 0:
+    return np.zeros(0, dtype=dtype)
+  return np.memmap(path, dtype=dtype, mode="r")
+
+
+def load_token_ids(target_path):
+  """Map the binary token-id files of target_path into memory.
+
+  The files are not read or parsed: the pages are loaded on access and are
+  shared through the page cache by all processes which map them.
+
+  Args:
+    target_path: the path the token-ids were written to by data_to_token_ids
+      with binary=True.
+
+  Returns:
+    a pair (token_ids, offsets) of read-only arrays: the token ids of line n
+    are token_ids[offsets[n]:offsets[n + 1]].
+  """
+  tokens_path, offsets_path = token_ids_files(target_path)
+  return _memmap(tokens_path, _TOKENS_DTYPE), _memmap(offsets_path, _OFFSETS_DTYPE)
+
+
+def prepare_data(data_dir, code_vocabulary_size, en_vocabulary_size, tokenizer=None,
+                 num_workers=1, max_tokens_in_memory=None, binary_ids=False,
+                 code_tokenizer=None, tokenizer_name="", train_name="train/90pt.random",
+                 dev_name="dev/10pt.random"):
     """Get WMT data into data_dir, create vocabularies and tokenize data.
 
+    Every vocabulary and token-id file has a manifest with the hashes of its
+    inputs and its settings, only the files which are missing or stale are
+    made again (see manifest.py).
+
     Args:
         data_dir: directory in which the data sets will be stored.
         code_vocabulary_size: max size of the code vocabulary to create and use.
         en_vocabulary_size: max size of the English vocabulary to create and use.
         tokenizer: a function to use to tokenize each data sentence;
           if None, basic_tokenizer will be used.
+        num_workers: number of processes used to build the vocabularies and
+          the token-ids; with more than one, the four token-id conversions
+          run at the same time.
+        max_tokens_in_memory: if set, the maximum number of distinct tokens
+          counted in memory while building a vocabulary.
+        binary_ids: if true, write the token-ids in the binary format which
+          is memory-mapped by load_token_ids instead of as text.
+        code_tokenizer: the tokenizer of the code, if it differs from the
+          tokenizer of the English, for example a separately trained
+          subword.BPETokenizer.
+        tokenizer_name: added to the names of the vocabulary and token-id
+          files, so the files of different tokenizers are kept apart.
+        train_name: the path of the training files relative to data_dir,
+          without the .code and .en extension, as written by
+          utils/generate_random_dataset.py for the split ratio.
+        dev_name: the path of the development files relative to data_dir.
 
     Returns:
     A tuple of 6 elements:
@@ -241,34 +789,58 @@ def prepare_data(data_dir, code_vocabulary_size, en_vocabulary_size, tokenizer=N
     """
 
     # tokenizer = python_tokenizer
+    en_tokenizer = tokenizer
+    if code_tokenizer is None:
+        code_tokenizer = tokenizer
 
     # print (tokenizer)
 
     # Specify the data directories.
-    train_path = data_dir + "train/90pt.random"
-    dev_path = data_dir + "dev/10pt.random"
+    train_path = data_dir + train_name
+    dev_path = data_dir + dev_name
 
     # Create vocabularies of the appropriate sizes.
-    en_vocab_path = os.path.join(data_dir, "vocab%d.en" % en_vocabulary_size)
-    code_vocab_path = os.path.join(data_dir, "vocab%d.code" % code_vocabulary_size)
-    create_vocabulary(en_vocab_path, train_path + ".en", en_vocabulary_size, tokenizer)
+    en_vocab_path = os.path.join(data_dir, "vocab%d%s.en" % (en_vocabulary_size, tokenizer_name))
+    code_vocab_path = os.path.join(data_dir, "vocab%d%s.code" % (code_vocabulary_size, tokenizer_name))
+    create_vocabulary(en_vocab_path, train_path + ".en", en_vocabulary_size, en_tokenizer,
+                      num_workers=num_workers, max_tokens_in_memory=max_tokens_in_memory)
     # create_vocabulary(code_vocab_path, train_path + ".code", code_vocabulary_size, python_tokenizer)
-    create_vocabulary(code_vocab_path, train_path + ".code", code_vocabulary_size, tokenizer)
-
-    # Create token ids for the training data.
-    en_train_ids_path = train_path + (".ids%d.en" % en_vocabulary_size)
-    code_train_ids_path = train_path + (".ids%d.code" % code_vocabulary_size)
-    data_to_token_ids(train_path + ".en", en_train_ids_path, en_vocab_path, tokenizer)
-    # data_to_token_ids(train_path + ".code", code_train_ids_path, code_vocab_path, python_tokenizer)
-    data_to_token_ids(train_path + ".code", code_train_ids_path, code_vocab_path, tokenizer)
-    
-    # Create token ids for the development data.
-    en_dev_ids_path = dev_path + (".ids%d.en" % en_vocabulary_size)
-    code_dev_ids_path = dev_path + (".ids%d.code" % code_vocabulary_size)
-    data_to_token_ids(dev_path + ".en", en_dev_ids_path, en_vocab_path, tokenizer)
-    # data_to_token_ids(dev_path + ".code", code_dev_ids_path, code_vocab_path, python_tokenizer)
-    data_to_token_ids(dev_path + ".code", code_dev_ids_path, code_vocab_path, tokenizer)
-    
+    create_vocabulary(code_vocab_path, train_path + ".code", code_vocabulary_size, code_tokenizer,
+                      num_workers=num_workers, max_tokens_in_memory=max_tokens_in_memory)
+
+    # Create token ids for the training and development data.
+    en_train_ids_path = train_path + (".ids%d%s.en" % (en_vocabulary_size, tokenizer_name))
+    code_train_ids_path = train_path + (".ids%d%s.code" % (code_vocabulary_size, tokenizer_name))
+    en_dev_ids_path = dev_path + (".ids%d%s.en" % (en_vocabulary_size, tokenizer_name))
+    code_dev_ids_path = dev_path + (".ids%d%s.code" % (code_vocabulary_size, tokenizer_name))
+    # conversions = [(train_path + ".code", code_train_ids_path, code_vocab_path, python_tokenizer), ...]
+    conversions = [(train_path + ".en", en_train_ids_path, en_vocab_path, en_tokenizer),
+                   (train_path + ".code", code_train_ids_path, code_vocab_path, code_tokenizer),
+                   (dev_path + ".en", en_dev_ids_path, en_vocab_path, en_tokenizer),
+                   (dev_path + ".code", code_dev_ids_path, code_vocab_path, code_tokenizer)]
+
+    if num_workers > 1:
+        # the conversions are independent, they run at the same time in
+        # threads which share a single pool of worker processes
+        pool = multiprocessing.Pool(num_workers)
+        threads = multiprocessing.pool.ThreadPool(len(conversions))
+
+        def convert(conversion):
+            data_path, ids_path, vocab_path, conversion_tokenizer = conversion
+            data_to_token_ids(data_path, ids_path, vocab_path, conversion_tokenizer, binary=binary_ids,
+                              num_workers=num_workers, pool=pool)
+
+        try:
+            threads.map(convert, conversions)
+        finally:
+            threads.close()
+            pool.close()
+            pool.join()
+    else:
+        for (data_path, ids_path, vocab_path, conversion_tokenizer) in conversions:
+            data_to_token_ids(data_path, ids_path, vocab_path, conversion_tokenizer,
+                              binary=binary_ids)
+
     return (code_train_ids_path, en_train_ids_path,
         code_dev_ids_path, en_dev_ids_path,
         code_vocab_path, en_vocab_path)
@@ -0,0 +1,92 @@
+"""Manifests of the derived data files: vocabularies, token-ids and subword
+models.
+
+A manifest is a small JSON file next to the file it describes, with the
+sha1 of every input file and the settings the file was made with. A file is
+up to date when it exists and its manifest matches the current inputs and
+settings, so only the files of changed data, vocabulary sizes or tokenizers
+are made again.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import hashlib
+import json
+import os
+
+# Extension of the manifest of a file.
+_MANIFEST_EXT = ".manifest.json"
+
+# Block size in which the input files are hashed.
+_HASH_BLOCK = 1 << 20
+
+# The hashes of the files hashed by this process, by path, size and mtime.
+_file_hashes = {}
+
+
+def file_hash(path):
+  """The sha1 of the content of a file, remembered while it is unchanged."""
+  stat = os.stat(path)
+  key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+  if key not in _file_hashes:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+      for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+        digest.update(block)
+    _file_hashes[key] = digest.hexdigest()
+  return _file_hashes[key]
+
+
+def manifest_path(path):
+  """The path of the manifest of a file."""
+  return path + _MANIFEST_EXT
+
+
+def create(inputs, settings):
+  """The manifest of a file made from inputs with settings.
+
+  Args:
+    inputs: a dictionary with the path of every input file by its role, for
+      example {"data": data_path}; the roles are used instead of the paths
+      so a moved data directory stays up to date.
+    settings: a dictionary with the settings, JSON serializable.
+
+  Returns:
+    the manifest, a dictionary.
+  """
+  manifest = {"inputs": dict((role, file_hash(path)) for role, path in inputs.items()),
+              "settings": settings}
+  # the form in which it is read back
+  return json.loads(json.dumps(manifest))
+
+
+def is_up_to_date(outputs, manifest):
+  """Check if the output files exist and the manifest of the first one
+  matches manifest."""
+  if not all(os.path.exists(path) for path in outputs):
+    return False
+  path = manifest_path(outputs[0])
+  if not os.path.exists(path):
+    return False
+  with open(path) as f:
+    try:
+      return json.load(f) == manifest
+    except ValueError:
+      return False
+
+
+def write(output, manifest):
+  """Write the manifest of output, after the output is complete."""
+  path = manifest_path(output)
+  with open(path + ".tmp", "w") as f:
+    json.dump(manifest, f, indent=1, sort_keys=True)
+  os.rename(path + ".tmp", path)
+
+
+def remove(output):
+  """Remove the manifest of output before it is made again, so an
+  interrupted run does not leave a file which looks up to date."""
+  path = manifest_path(output)
+  if os.path.exists(path):
+    os.remove(path)
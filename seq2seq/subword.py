@@ -0,0 +1,271 @@
+"""Byte pair encoding subword tokenizer.
+
+The words found by basic_tokenizer are split into subwords: every character
+starts as a symbol and the most frequent adjacent pair of symbols in the
+training data is merged into a new symbol, until the requested number of
+distinct symbols is reached. A long identifier which would be a single rare
+token, and often _UNK, becomes a few frequent subwords, so a vocabulary of
+8k-16k subwords covers the data that needs 100k words.
+
+Every subword except the last one of a word ends with "@@", so the words
+are restored by decode. A BPETokenizer is a tokenizer for the tokenizer
+argument of data_utils.create_vocabulary and sentence_to_token_ids.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import hashlib
+import heapq
+import os
+
+import manifest
+
+from tokenizer import basic_tokenizer, normalize_digits, tokenize_lines
+
+# Marks the subwords which are continued by the next subword of the word.
+_CONTINUATION = b"@@"
+
+# Marks the last symbol of a word while training and encoding.
+_END = b"</w>"
+
+# Number of lines tokenized in a single batch when counting the words.
+_TOKENIZE_BATCH = 10000
+
+# Number of encoded words kept by a tokenizer.
+_CACHE_SIZE = 100000
+
+
+def _pairs(symbols):
+  """The adjacent pairs of symbols of a word."""
+  return zip(symbols, symbols[1:])
+
+
+def _merge(symbols, pair, new):
+  """Replace the occurrences of pair in symbols by new, from left to right."""
+  merged = []
+  i = 0
+  while i < len(symbols):
+    if i + 1 < len(symbols) and (symbols[i], symbols[i + 1]) == pair:
+      merged.append(new)
+      i += 2
+    else:
+      merged.append(symbols[i])
+      i += 1
+  return tuple(merged)
+
+
+def _symbols(word):
+  """The initial symbols of a word: its characters, the last one marked."""
+  return tuple(word[:-1]) + (word[-1] + _END,)
+
+
+class BPETokenizer(object):
+  """Split sentences into subwords by applying a list of merges.
+
+  Args:
+    merges: the list of pairs of symbols to merge, in the order they were
+      learned.
+    normalize_digits: Boolean; if true, all digits of the words are replaced
+      by 0s before they are split, as they were while training.
+  """
+
+  def __init__(self, merges, normalize_digits=True):
+    self.merges = list(merges)
+    self.ranks = dict((pair, rank) for rank, pair in
+                      reversed(list(enumerate(self.merges))))
+    self.normalize_digits = normalize_digits
+    self._cache = {}
+
+  def encode_word(self, word):
+    """Split a single word into its subwords."""
+    if word in self._cache:
+      return self._cache[word]
+
+    symbols = _symbols(word)
+    while len(symbols) > 1:
+      ranked = [(self.ranks[pair], pair) for pair in _pairs(symbols)
+                if pair in self.ranks]
+      if not ranked:
+        break
+      _, pair = min(ranked)
+      symbols = _merge(symbols, pair, pair[0] + pair[1])
+
+    subwords = [s + _CONTINUATION for s in symbols[:-1]]
+    subwords.append(symbols[-1][:-len(_END)])
+    if len(self._cache) >= _CACHE_SIZE:
+      self._cache.clear()
+    self._cache[word] = subwords
+    return subwords
+
+  def __call__(self, sentence):
+    """Tokenize a sentence into the subwords of its words."""
+    subwords = []
+    for word in basic_tokenizer(sentence):
+      if self.normalize_digits:
+        word = normalize_digits(word)
+      subwords.extend(self.encode_word(word))
+    return subwords
+
+  def fingerprint(self):
+    """A description of the tokenizer for the manifests of data_utils,
+    which changes when the merges change."""
+    digest = hashlib.sha1()
+    for pair in self.merges:
+      digest.update(b"%s %s\n" % pair)
+    return "bpe:%d:%s" % (self.normalize_digits, digest.hexdigest())
+
+  def save(self, path):
+    """Write the merges to a file, one pair per line."""
+    with open(path + ".tmp", "wb") as model_file:
+      model_file.write(b"#bpe normalize_digits=%d\n" % self.normalize_digits)
+      for pair in self.merges:
+        model_file.write(b"%s %s\n" % pair)
+    os.rename(path + ".tmp", path)
+
+  @classmethod
+  def load(cls, path):
+    """Read a tokenizer written by save."""
+    with open(path, "rb") as model_file:
+      header = model_file.readline().split()
+      if not header or header[0] != b"#bpe":
+        raise ValueError("%s is not a subword model" % path)
+      options = dict(option.split(b"=") for option in header[1:])
+      merges = [tuple(line.split()) for line in model_file]
+    return cls(merges, bool(int(options.get(b"normalize_digits", 1))))
+
+  # the cache is not sent to the worker processes of data_utils
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    state["_cache"] = {}
+    return state
+
+
+def decode(subwords):
+  """Join subwords into the space separated words they were split from."""
+  sentence = b" ".join(subwords).replace(_CONTINUATION + b" ", b"")
+  if sentence.endswith(_CONTINUATION):
+    sentence = sentence[:-len(_CONTINUATION)]
+  return sentence
+
+
+def count_words(data_path, normalize=True):
+  """Count the words of basic_tokenizer in a data file."""
+  counts = collections.Counter()
+  with open(data_path, "rb") as data_file:
+    batch = []
+    for line in data_file:
+      batch.append(line)
+      if len(batch) == _TOKENIZE_BATCH:
+        for words in tokenize_lines(batch, normalize):
+          counts.update(words)
+        batch = []
+    for words in tokenize_lines(batch, normalize):
+      counts.update(words)
+  return counts
+
+
+def train(word_counts, num_symbols, normalize=True, min_frequency=2):
+  """Learn the merges of a tokenizer from word counts.
+
+  The counts of the pairs of symbols are updated only for the words which
+  contain a merged pair, and the most frequent pair is taken from a heap, so
+  a merge costs time in the number of words it changes.
+
+  Args:
+    word_counts: a dictionary with the count of every word.
+    num_symbols: the number of distinct symbols to stop at; the vocabulary
+      of the tokenized data has about this size.
+    normalize: Boolean; if true, the words were counted with normalized
+      digits and the tokenizer normalizes them too.
+    min_frequency: pairs which occur less often are not merged.
+
+  Returns:
+    a BPETokenizer with the learned merges.
+  """
+  words = []
+  counts = []
+  symbol_counts = collections.defaultdict(int)
+  stats = collections.defaultdict(int)
+  index = collections.defaultdict(set)
+  for word, count in sorted(word_counts.items()):
+    symbols = _symbols(word)
+    for s in symbols:
+      symbol_counts[s] += count
+    for pair in _pairs(symbols):
+      stats[pair] += count
+      index[pair].add(len(words))
+    words.append(symbols)
+    counts.append(count)
+
+  # the most frequent pair first, ties in the order of the pairs
+  heap = [(-count, pair) for pair, count in stats.items()]
+  heapq.heapify(heap)
+
+  merges = []
+  while heap and len(symbol_counts) < num_symbols:
+    count, pair = heapq.heappop(heap)
+    if stats.get(pair) != -count:
+      # the count changed after this entry was pushed
+      continue
+    if -count < min_frequency:
+      break
+
+    merges.append(pair)
+    new = pair[0] + pair[1]
+    changed = set()
+    for i in index.pop(pair):
+      old = words[i]
+      merged = _merge(old, pair, new)
+      if merged == old:
+        continue
+      words[i] = merged
+
+      for s in old:
+        symbol_counts[s] -= counts[i]
+        if symbol_counts[s] == 0:
+          del symbol_counts[s]
+      for s in merged:
+        symbol_counts[s] += counts[i]
+      for p in _pairs(old):
+        stats[p] -= counts[i]
+        changed.add(p)
+      for p in _pairs(merged):
+        stats[p] += counts[i]
+        index[p].add(i)
+        changed.add(p)
+
+    for p in changed:
+      if stats[p] > 0:
+        heapq.heappush(heap, (-stats[p], p))
+      else:
+        del stats[p]
+
+  return BPETokenizer(merges, normalize)
+
+
+def get_tokenizer(model_path, data_path, num_symbols, normalize=True):
+  """Load the tokenizer at model_path, or train it on data_path and save it
+  when it is missing or was trained on other data or settings.
+
+  Args:
+    model_path: path of the file with the merges.
+    data_path: path to the training data in one-sentence-per-line format.
+    num_symbols: the number of distinct symbols to stop at.
+    normalize: Boolean; if true, all digits are replaced by 0s.
+
+  Returns:
+    the BPETokenizer.
+  """
+  model_manifest = manifest.create(
+      {"data": data_path}, {"num_symbols": num_symbols, "normalize": normalize})
+  if manifest.is_up_to_date([model_path], model_manifest):
+    return BPETokenizer.load(model_path)
+
+  manifest.remove(model_path)
+  print("Training subword model %s from data %s" % (model_path, data_path))
+  bpe = train(count_words(data_path, normalize), num_symbols, normalize)
+  bpe.save(model_path)
+  manifest.write(model_path, model_manifest)
+  return bpe
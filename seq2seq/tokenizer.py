@@ -0,0 +1,55 @@
+"""Tokenizer shared by the dataset generation and the data preparation.
+
+The length filter of the extractors in dataset_generation and the vocabulary
+and token-id conversion of data_utils use the same token definition: runs of
+characters separated by whitespace, with punctuation split off as separate
+tokens. The regular expressions are compiled once at import time.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import re
+
+# The punctuation which is split off as separate tokens.
+_PUNCTUATION = b"`.,!?\"':;)("
+
+# A token is a single punctuation character or a run of other non-space
+# characters, the same tokens as splitting every whitespace separated
+# fragment on the punctuation.
+_TOKEN_RE = re.compile(b"[" + re.escape(_PUNCTUATION) + b"]|[^\\s" +
+                       re.escape(_PUNCTUATION) + b"]+")
+_DIGIT_RE = re.compile(br"\d")
+
+
+def basic_tokenizer(sentence):
+  """Very basic tokenizer: split the sentence into a list of tokens."""
+  return _TOKEN_RE.findall(sentence)
+
+
+def token_count(sentence):
+  """Number of tokens basic_tokenizer splits the sentence into."""
+  return len(_TOKEN_RE.findall(sentence))
+
+
+def normalize_digits(token):
+  """Replace all digits in a token or sentence by 0s."""
+  return _DIGIT_RE.sub(b"0", token)
+
+
+def tokenize_lines(lines, normalize=False):
+  """Tokenize a batch of lines at once.
+
+  Args:
+    lines: a list of sentences, each without newlines except a trailing one.
+    normalize: Boolean; if true, all digits are replaced by 0s.
+
+  Returns:
+    a list with the list of tokens of every line.
+  """
+  if normalize and lines:
+    # substitute the digits of the whole batch in a single call
+    lines = _DIGIT_RE.sub(b"0", b"\n".join(line.rstrip(b"\n") for line in lines))
+    lines = lines.split(b"\n")
+  findall = _TOKEN_RE.findall
+  return [findall(line) for line in lines]
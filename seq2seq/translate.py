@@ -48,6 +48,7 @@ import tensorflow as tf
 
 import data_utils
 import seq2seq_model
+import subword
 
 from evaluation.meteor.meteor import Meteor
 
@@ -66,9 +67,21 @@ tf.app.flags.DEFINE_integer("size", 256, "Size of each model layer.")
 tf.app.flags.DEFINE_integer("num_layers", 1, "Number of layers in the model.")
 tf.app.flags.DEFINE_integer("code_vocab_size", 100000, "Program vocabulary size.")
 tf.app.flags.DEFINE_integer("en_vocab_size", 100000, "English vocabulary size.")
+tf.app.flags.DEFINE_integer("num_workers", 1, "Number of processes used to build the vocabularies.")
+tf.app.flags.DEFINE_boolean("binary_ids", False,
+                            "Store the token-ids in memory-mapped binary files instead of text.")
+tf.app.flags.DEFINE_boolean("subword", False,
+                            "Split the words into subwords, with code_vocab_size and en_vocab_size subwords.")
+tf.app.flags.DEFINE_integer("encode_cache_size", 0,
+                            "Number of encoded sentences kept when translating (0: no cache).")
+tf.app.flags.DEFINE_integer("translation_cache_size", 0,
+                            "Number of translations of repeated sentences kept (0: no cache).")
+tf.app.flags.DEFINE_integer("max_vocab_tokens_in_memory", 0,
+                            "Limit on the distinct tokens counted in memory per vocabulary (0: no limit).")
 tf.app.flags.DEFINE_string("data_dir", "/home/tjalling/Desktop/thesis/tensorflow/implementations/seq2seq/data/", "Data directory")
 tf.app.flags.DEFINE_string("train_dir", "/home/tjalling/Desktop/thesis/tensorflow/implementations/seq2seq/train/", "Training directory.")
 tf.app.flags.DEFINE_string("dataset", "allCode", "Specify the name of which dataset to use.")
+tf.app.flags.DEFINE_string("train_files", "train/90pt.random", "The file path to the training files, relative from the data_dir.")
 tf.app.flags.DEFINE_string("dev_files", "dev/10pt.random", "The file path to the English dev file, relative from the data_dir.")
 tf.app.flags.DEFINE_string("translated_dev_code", "dev/translated.en", "The dev file with Code translated into English.")
 tf.app.flags.DEFINE_integer("max_train_data_size", 0,
@@ -95,7 +108,38 @@ translated_dev_code = data_dir + FLAGS.translated_dev_code
 _buckets = [(5, 10), (10, 15), (20, 25), (40, 50), (250,100)]
 
 
-def read_data(source_path, target_path, max_size=None):
+def get_tokenizers():
+  """The tokenizers of the code and the English: the subword tokenizers
+  trained on the training data with --subword, else None for the basic
+  tokenizer."""
+  if not FLAGS.subword:
+    return None, None
+  sizes = [("code", FLAGS.code_vocab_size), ("en", FLAGS.en_vocab_size)]
+  return [subword.get_tokenizer(os.path.join(data_dir, "bpe%d.%s" % (size, kind)),
+                                data_dir + FLAGS.train_files + "." + kind,
+                                size - len(data_utils._START_VOCAB))
+          for kind, size in sizes]
+
+
+def tokenizer_name():
+  """The name of the tokenizer in the vocabulary and token-id files."""
+  return ".bpe" if FLAGS.subword else ""
+
+
+def vocab_paths():
+  """The paths of the code and English vocabularies."""
+  return (os.path.join(data_dir, "vocab%d%s.code" % (FLAGS.code_vocab_size, tokenizer_name())),
+          os.path.join(data_dir, "vocab%d%s.en" % (FLAGS.en_vocab_size, tokenizer_name())))
+
+
+def join_output(tokens):
+  """The sentence of the output tokens, subwords are joined into words."""
+  if FLAGS.subword:
+    return subword.decode(tokens)
+  return " ".join(tokens)
+
+
+def read_data(source_path, target_path, max_size=None, binary=False):
   """Read data from source and target files and put into buckets.
 
   Args:
@@ -105,6 +149,9 @@ def read_data(source_path, target_path, max_size=None):
       output for n-th line from the source_path.
     max_size: maximum number of lines to read, all other will be ignored;
       if 0 or None, data files will be read completely (no limit).
+    binary: Boolean; if true, read the binary token-id files of the paths
+      written by data_utils.data_to_token_ids with binary=True instead of
+      the text files.
 
   Returns:
     data_set: a list of length len(_buckets); data_set[n] contains a list of
@@ -112,6 +159,9 @@ def read_data(source_path, target_path, max_size=None):
       into the n-th bucket, i.e., such that len(source) < _buckets[n][0] and
       len(target) < _buckets[n][1]; source and target are lists of token-ids.
   """
+  if binary:
+    return read_binary_data(source_path, target_path, max_size)
+
   data_set = [[] for _ in _buckets]
   with tf.gfile.GFile(source_path, mode="r") as source_file:
     with tf.gfile.GFile(target_path, mode="r") as target_file:
@@ -133,6 +183,81 @@ def read_data(source_path, target_path, max_size=None):
   return data_set
 
 
+def read_binary_data(source_path, target_path, max_size=None):
+  """Read data from memory-mapped binary token-id files into buckets.
+
+  The same as read_data, but the lengths of all lines are taken from the
+  offsets and the buckets are assigned at once, so only the token ids of
+  the lines which fit into a bucket are read and nothing is parsed.
+  """
+  source_ids, source_offsets = data_utils.load_token_ids(source_path)
+  target_ids, target_offsets = data_utils.load_token_ids(target_path)
+  size = max(min(len(source_offsets), len(target_offsets)) - 1, 0)
+  if max_size:
+    size = min(size, max_size)
+
+  source_lengths = np.diff(source_offsets[:size + 1])
+  # the target gets an EOS symbol
+  target_lengths = np.diff(target_offsets[:size + 1]) + 1
+  unassigned = np.ones(size, dtype=bool)
+
+  # plain views and integer offsets are much cheaper to slice per line
+  source_ids, target_ids = np.asarray(source_ids), np.asarray(target_ids)
+  source_offsets = source_offsets[:size + 1].tolist()
+  target_offsets = target_offsets[:size + 1].tolist()
+
+  data_set = [[] for _ in _buckets]
+  for bucket_id, (source_size, target_size) in enumerate(_buckets):
+    fits = unassigned & (source_lengths < source_size) & (target_lengths < target_size)
+    unassigned &= ~fits
+    for n in np.nonzero(fits)[0].tolist():
+      source = source_ids[source_offsets[n]:source_offsets[n + 1]].tolist()
+      target = target_ids[target_offsets[n]:target_offsets[n + 1]].tolist()
+      target.append(data_utils.EOS_ID)
+      data_set[bucket_id].append([source, target])
+  print("  read %d data lines" % size)
+  return data_set
+
+
+def translate_ids(sess, model, token_ids, bucket_id, rev_en_vocab):
+    """Translate the token-ids of a sentence with the model in the bucket."""
+    # Get a 1-element batch to feed the sentence to the model.
+    encoder_inputs, decoder_inputs, target_weights = model.get_batch(
+        {bucket_id: [(token_ids, [])]}, bucket_id)
+
+    # Get output logits for the sentence.
+    _, _, output_logits = model.step(sess, encoder_inputs, decoder_inputs,
+                                     target_weights, bucket_id, True)
+
+    # This is a greedy decoder - outputs are just argmaxes of output_logits.
+    outputs = [int(np.argmax(logit, axis=1)) for logit in output_logits]
+
+    # If there is an EOS symbol in outputs, cut them at that point.
+    if data_utils.EOS_ID in outputs:
+        outputs = outputs[:outputs.index(data_utils.EOS_ID)]
+    return join_output([tf.compat.as_str(rev_en_vocab[output]) for output in outputs])
+
+
+def cached_translation(sess, model, token_ids, bucket_id, rev_en_vocab, translations):
+    """Translate the token-ids of a sentence, or take the translation from
+    the translations cache; the greedy decoder always gives the same
+    translation for the same token-ids."""
+    key = tuple(token_ids)
+    translation = translations.get(key)
+    if translation is None:
+        translation = translate_ids(sess, model, token_ids, bucket_id, rev_en_vocab)
+        translations.put(key, translation)
+    return translation
+
+
+def print_cache_stats(encoder, translations):
+    """Print the hits and misses of the encoding and translation caches."""
+    if encoder.cache is not None:
+        print(" Encoding cache: %s" % encoder.cache.stats())
+    if translations.size > 0:
+        print(" Translation cache: %s" % translations.stats())
+
+
 def translate_file(source_path=dev_code_file, target_path=translated_dev_code): 
     gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=0.4)
     with tf.Session(config = tf.ConfigProto(gpu_options = gpu_options)) as sess:
@@ -141,66 +266,47 @@ def translate_file(source_path=dev_code_file, target_path=translated_dev_code):
         model.batch_size = 1  # We decode one sentence at a time.
 
         # Load vocabularies.
-        code_vocab_path = os.path.join(data_dir,
-           "vocab%d.code" % FLAGS.code_vocab_size)
-        en_vocab_path = os.path.join(data_dir,
-           "vocab%d.en" % FLAGS.en_vocab_size)
-        code_vocab, _ = data_utils.initialize_vocabulary(code_vocab_path)
+        code_vocab_path, en_vocab_path = vocab_paths()
+        code_tokenizer, _ = get_tokenizers()
+        encoder = data_utils.SentenceEncoder(code_vocab_path, code_tokenizer,
+                                             cache_size=FLAGS.encode_cache_size)
         _, rev_en_vocab = data_utils.initialize_vocabulary(en_vocab_path)
+        translations = data_utils.LRUCache(FLAGS.translation_cache_size)
 
         with tf.gfile.GFile(source_path, mode="r") as source_file:
             with tf.gfile.GFile(target_path, mode="w") as translated_file:
             
-                sentence = source_file.readline()
                 counter = 0
                 print (" Translating file %s " % dev_code_file)
                 
-                while sentence:
-                    # Get token-ids for the input sentence.
-                    token_ids = data_utils.sentence_to_token_ids(tf.compat.as_bytes(sentence), code_vocab)
-
+                # Get token-ids for the input sentences, a batch at a time.
+                for token_ids in encoder.iter_encode(source_file):
                     buckets = [b for b in xrange(len(_buckets)) if _buckets[b][0] > len(token_ids)]
                     if buckets:
                         bucket_id = min(buckets)
                     else:
                         # print ("line %d with tokens %d" % (counter, len(token_ids)))
                         translated_file.write("_UNK \n")
-                        sentence = source_file.readline()
                         continue
                     
                     # Which bucket does it belong to?
                     # bucket_id = min([b for b in xrange(len(_buckets))
                                     # if _buckets[b][0] > len(token_ids)])
                                     
-                    # Get a 1-element batch to feed the sentence to the model.
-                    encoder_inputs, decoder_inputs, target_weights = model.get_batch(
-                                                                                            {bucket_id: [(token_ids, [])]}, bucket_id)
-
-                    # Get output logits for the sentence.
-                    _, _, output_logits = model.step(sess, encoder_inputs, decoder_inputs,
-                                                                    target_weights, bucket_id, True)
-                                                                    
-                                                                    
-                    # This is a greedy decoder - outputs are just argmaxes of output_logits.
-                    outputs = [int(np.argmax(logit, axis=1)) for logit in output_logits]
-
-                    # If there is an EOS symbol in outputs, cut them at that point.
-                    if data_utils.EOS_ID in outputs:
-                        outputs = outputs[:outputs.index(data_utils.EOS_ID)]
-                        
+                    # Translate the sentence, a repeated sentence comes from the cache.
+                    translation = cached_translation(sess, model, token_ids, bucket_id,
+                                                     rev_en_vocab, translations)
+
                     # Write translated sentence to translation file.
-                    translated_file.write(" ".join([tf.compat.as_str(rev_en_vocab[output]) for output in outputs]) + "\n")
-                    
-                    # print ("> %s" % sentence)
-                    # print(" ".join([tf.compat.as_str(rev_en_vocab[output]) for output in outputs]))
+                    translated_file.write(translation + "\n")
                     
                     # Get next sentence and print checkpoints.
                     counter +=1
-                    sentence = source_file.readline()
                     if( counter % 500 is 0):
                         print(" Line %d translated" % counter)
                     
                 print (" File translated")
+                print_cache_stats(encoder, translations)
                 
 
 
@@ -226,8 +332,14 @@ def train():
     # Prepare WMT data.
     print("Preparing data in %s" % data_dir)
 
+    code_tokenizer, en_tokenizer = get_tokenizers()
     code_train, en_train, code_dev, en_dev, _, _ = data_utils.prepare_data(
-        data_dir, FLAGS.code_vocab_size, FLAGS.en_vocab_size)
+        data_dir, FLAGS.code_vocab_size, FLAGS.en_vocab_size, en_tokenizer,
+        num_workers=FLAGS.num_workers,
+        max_tokens_in_memory=FLAGS.max_vocab_tokens_in_memory or None,
+        binary_ids=FLAGS.binary_ids, code_tokenizer=code_tokenizer,
+        tokenizer_name=tokenizer_name(), train_name=FLAGS.train_files,
+        dev_name=FLAGS.dev_files)
     
     gpu_options = tf.GPUOptions(per_process_gpu_memory_fraction=0.3)
     with tf.Session(config = tf.ConfigProto(gpu_options = gpu_options)) as sess:
@@ -238,8 +350,9 @@ def train():
         # Read data into buckets and compute their sizes.
         print ("Reading development and training data (limit: %d)."
                % FLAGS.max_train_data_size)
-        dev_set = read_data(code_dev, en_dev)
-        train_set = read_data(code_train, en_train, FLAGS.max_train_data_size)
+        dev_set = read_data(code_dev, en_dev, binary=FLAGS.binary_ids)
+        train_set = read_data(code_train, en_train, FLAGS.max_train_data_size,
+                              binary=FLAGS.binary_ids)
         train_bucket_sizes = [len(train_set[b]) for b in xrange(len(_buckets))]
         train_total_size = float(sum(train_bucket_sizes))
 
@@ -352,12 +465,12 @@ def decode():
         model.batch_size = 1  # We decode one sentence at a time.
 
         # Load vocabularies.
-        code_vocab_path = os.path.join(data_dir,
-           "vocab%d.code" % FLAGS.code_vocab_size)
-        en_vocab_path = os.path.join(data_dir,
-           "vocab%d.en" % FLAGS.en_vocab_size)
-        code_vocab, _ = data_utils.initialize_vocabulary(code_vocab_path)
+        code_vocab_path, en_vocab_path = vocab_paths()
+        code_tokenizer, _ = get_tokenizers()
+        encoder = data_utils.SentenceEncoder(code_vocab_path, code_tokenizer,
+                                             cache_size=FLAGS.encode_cache_size)
         _, rev_en_vocab = data_utils.initialize_vocabulary(en_vocab_path)
+        translations = data_utils.LRUCache(FLAGS.translation_cache_size)
 
         # Decode from standard input.
         sys.stdout.write("> ")
@@ -365,31 +478,20 @@ def decode():
         sentence = sys.stdin.readline()
         while sentence:
             # Get token-ids for the input sentence.
-            token_ids = data_utils.sentence_to_token_ids(tf.compat.as_bytes(sentence), code_vocab)
+            token_ids = encoder.encode([tf.compat.as_bytes(sentence)])[0]
 
             # print (token_ids)
 
             # Which bucket does it belong to?
             bucket_id = min([b for b in xrange(len(_buckets))
                             if _buckets[b][0] > len(token_ids)])
-            # Get a 1-element batch to feed the sentence to the model.
-            encoder_inputs, decoder_inputs, target_weights = model.get_batch(
-            {bucket_id: [(token_ids, [])]}, bucket_id)
-
-            # Get output logits for the sentence.
-            _, _, output_logits = model.step(sess, encoder_inputs, decoder_inputs,
-            target_weights, bucket_id, True)
-            # This is a greedy decoder - outputs are just argmaxes of output_logits.
-            outputs = [int(np.argmax(logit, axis=1)) for logit in output_logits]
-
-            # If there is an EOS symbol in outputs, cut them at that point.
-            if data_utils.EOS_ID in outputs:
-                outputs = outputs[:outputs.index(data_utils.EOS_ID)]
-            # Print out French sentence corresponding to outputs.
-            print(" ".join([tf.compat.as_str(rev_en_vocab[output]) for output in outputs]))
+            # Print out the English sentence corresponding to outputs.
+            print(cached_translation(sess, model, token_ids, bucket_id, rev_en_vocab,
+                                     translations))
             print("> ", end="")
             sys.stdout.flush()
             sentence = sys.stdin.readline()
+        print_cache_stats(encoder, translations)
 
 
 def self_test():
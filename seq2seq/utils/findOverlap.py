@@ -5,28 +5,20 @@
 # Date: June, 2016
 ###########################################################################################################
 
+import overlap
+
 testFile = "../data/allCode/dev/10pt.random"
 trainFile = "../data/allCode/train/90pt.random"
 
-extensions = [".en",".code"]
-
-
-for extension in extensions:
-
-    with open(testFile + extension) as f:
-        testF = f.readlines()
-
-    with open(trainFile + extension) as f:
-        trainF = f.readlines()
-
-    overlap = 0
-    for line in testF:
-    	if line in trainF:
-    		overlap += 1
-
+# the ways lines are compared, see overlap.normalisers
+modes = ["exact", "whitespace", "tokens"]
 
-    # overlap = len(set(testF) & set(trainF))
-    testLines = len(testF)
-    overlapPercentage = (overlap / (testLines * 1.0)) * 100
+# hash the training set once, then check every dev line against it
+index = overlap.OverlapIndex(trainFile, modes)
+(counts, testLines) = index.overlap(testFile)
 
-    print "Overlap of " , extension , ' is: ', overlap , '/', testLines , ' = ' , overlapPercentage , ' % '
\ No newline at end of file
+for mode in modes:
+    print "Overlap with" , mode , "matching:"
+    for kind in index.kinds:
+        overlapPercentage = (counts[(mode, kind)] / (testLines * 1.0)) * 100
+        print "Overlap of " , kind , ' is: ', counts[(mode, kind)] , '/', testLines , ' = ' , overlapPercentage , ' % '
@@ -5,11 +5,13 @@
 # Date: June, 2016
 ###########################################################################################################
 
+import overlap
+
 file = "allCode_sub4_3x512_bleu8.en"
 
 testFile = "../data/edx_pylearn_scikit_salt/dev/10pt.random.en"
 testFileSpaced = "../data/edx_pylearn_scikit_salt/dev/10pt.random.spaced.en"
-trainFile = "../data/edx_pylearn_scikit_salt/train/90pt.random.en"
+trainFile = "../data/edx_pylearn_scikit_salt/train/90pt.random"
 transFile = "../evaluation/bleu/bleu_test_data/" + file
 
 
@@ -17,8 +19,8 @@ transFile = "../evaluation/bleu/bleu_test_data/" + file
 with open(testFile) as f:
     testF = f.readlines()
 
-with open(trainFile) as f:
-    trainF = f.readlines()
+# hash the training annotations once instead of scanning them for every line
+trainIndex = overlap.OverlapIndex(trainFile, kinds=["en"])
 
 with open(testFileSpaced) as f:
     testSpacedF = f.readlines()
@@ -38,7 +40,7 @@ for i in xrange(len(testF)):
 		equal += 1
 
 		# check if the translation was in the overlap
-		if testF[i] in trainF:
+		if trainIndex.contains("en", testF[i]):
 			inOverlap += 1
 	counter += 1
 
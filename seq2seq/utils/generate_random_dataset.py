@@ -5,64 +5,90 @@
 # Date: May, 2016
 ###########################################################################################################
 
+import argparse
+import hashlib
+import itertools
 import os
-import sys
-import subprocess
-import re
-import random
-
-
-# this function adds spaces around all punctuation in the specified file, and writes it to the output file
-def gen_random_dataset(): 
-
-    input_code_file = "../data/allCodeCommentOnly/all.code"
-    input_en_file = "../data/allCodeCommentOnly/all.en"
-    output_dev_en_file = "../data/allCodeCommentOnly/dev/10pt.random.en"
-    output_dev_code_file = "../data/allCodeCommentOnly/dev/10pt.random.code"
-    output_train_code_file = "../data/allCodeCommentOnly/train/90pt.random.code"
-    output_train_en_file = "../data/allCodeCommentOnly/train/90pt.random.en"
-
-
-    # read the original files
-    with open(input_code_file) as f:
-        code_file = f.readlines()
-    with open(input_en_file) as g:
-        en_file = g.readlines()
-
-    fileLength = len(code_file)
-    # create a list with all lines shuffled
-    indices = random.sample(range(0, fileLength), fileLength)
-
-    # open the dev files
-    with open(output_dev_en_file, 'w') as dev_en_file:
-        with open(output_dev_code_file, 'w') as dev_code_file:
-                
-            # write 10% random lines to the dev files
-            for x in xrange(0, int(round(0.1 * fileLength))):
-                dev_en_file.write(en_file[indices[x]])
-                dev_code_file.write(code_file[indices[x]])
-
-    print ("Dev files created.")
-
-    # open the train files
-    with open(output_train_en_file, 'w') as train_en_file:
-        with open(output_train_code_file, 'w') as train_code_file:
-
-            # write 90% random lines to the train files
-            for x in xrange(int(round(0.1 * fileLength)), fileLength):
-                train_en_file.write(en_file[indices[x]])
-                train_code_file.write(code_file[indices[x]])
-
-    print ("Train files created.")
+import struct
+
+
+# the fraction in [0, 1) a key is hashed to, the same for every run with the same seed
+def hash_fraction(key, seed):
+    digest = hashlib.sha1("%d\0%s" % (seed, key)).digest()
+    return struct.unpack("<Q", digest[:8])[0] / float(1 << 64)
+
+
+# split all.code and all.en of the data directory into a dev and a train set in a single pass.
+# Every pair goes to the dev set when the seeded hash of the pair is below dev_ratio, so the
+# split is reproducible and only a single pair is kept in memory. With group_by_file the hash
+# of the source file in all.src is used instead, so all pairs of a file end up in the same set,
+# a pair without a source file is an error then. The files must have the same number of lines.
+def gen_random_dataset(data_dir="../data/allCodeCommentOnly", dev_ratio=0.1, seed=0, group_by_file=False):
+
+    input_code_file = os.path.join(data_dir, "all.code")
+    input_en_file = os.path.join(data_dir, "all.en")
+    input_src_file = os.path.join(data_dir, "all.src")
+
+    dev_name = "%dpt.random" % round(dev_ratio * 100)
+    train_name = "%dpt.random" % round((1 - dev_ratio) * 100)
+    output_dev = os.path.join(data_dir, "dev", dev_name)
+    output_train = os.path.join(data_dir, "train", train_name)
+
+    for directory in [os.path.dirname(output_dev), os.path.dirname(output_train)]:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    code_file = open(input_code_file)
+    en_file = open(input_en_file)
+
+    # without group_by_file the pairs are split by the hash of the pair
+    input_files = [code_file, en_file]
+    if group_by_file:
+        input_files.append(open(input_src_file))
+
+    outputs = [(open(output_train + ".code", 'w'), open(output_train + ".en", 'w')),
+               (open(output_dev + ".code", 'w'), open(output_dev + ".en", 'w'))]
+    counts = [0, 0]
+
+    # izip_longest, so files of different lengths are not silently truncated
+    for (line_no, lines) in enumerate(itertools.izip_longest(*input_files), 1):
+        if None in lines:
+            raise ValueError("the files %s have different lengths, line %d is missing in one of them"
+                             % (", ".join(f.name for f in input_files), line_no))
+        (code_line, en_line) = lines[:2]
+
+        if group_by_file:
+            key = lines[2].strip()
+            if key == "":
+                raise ValueError("line %d of %s has no source file, it cannot be split by file"
+                                 % (line_no, input_src_file))
+        else:
+            key = code_line + "\0" + en_line
+
+        dev = int(hash_fraction(key, seed) < dev_ratio)
+        outputs[dev][0].write(code_line)
+        outputs[dev][1].write(en_line)
+        counts[dev] += 1
+
+    for f in input_files + [f for output in outputs for f in output]:
+        f.close()
+
+    print ("Dev files created: %d pairs in %s" % (counts[1], output_dev))
+    print ("Train files created: %d pairs in %s" % (counts[0], output_train))
+    print ("Train with --train_files %s --dev_files %s" % (os.path.join("train", train_name), os.path.join("dev", dev_name)))
     print ("Done.")
 
 
-# def main(_):
-#     gen_random_dataset()
-#     # os.system("python punctuation_police.py")
-
-
-
-
 if __name__ == "__main__":
-    gen_random_dataset()
+    parser = argparse.ArgumentParser(description="Split a dataset into a dev and a train set.")
+    parser.add_argument("data_dir", nargs="?", default="../data/allCodeCommentOnly",
+                        help="directory with all.code and all.en (default %(default)s)")
+    parser.add_argument("--dev-ratio", type=float, default=0.1,
+                        help="fraction of the pairs in the dev set (default %(default)s)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="seed of the hash which assigns the pairs (default %(default)s)")
+    parser.add_argument("--group-by-file", action="store_true",
+                        help="keep the pairs of a source file together, using all.src")
+    args = parser.parse_args()
+
+    gen_random_dataset(args.data_dir, args.dev_ratio, args.seed, args.group_by_file)
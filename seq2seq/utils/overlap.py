@@ -0,0 +1,93 @@
+###########################################################################################################
+# Author: Tjalling Haije
+# Project: code-to-comment
+# For: Bsc AI, University of Amsterdam
+# Date: June, 2016
+###########################################################################################################
+
+# Overlap between a training set and a dev set. The lines of the training set are
+# hashed into an index once, after which every dev line is checked in constant time.
+
+import hashlib
+import imp
+import itertools
+import os
+import struct
+
+# the tokenizer of data_utils, in the parent directory. It is loaded from its file
+# under its own name, so another module called tokenizer on sys.path can't take
+# its place.
+basic_tokenizer = imp.load_source("seq2seq_tokenizer",
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                                               "tokenizer.py")).basic_tokenizer
+
+extensions = {"code": ".code", "en": ".en"}
+
+
+# the ways two lines can be equal: the exact line, the line with all
+# whitespace collapsed and the tokens of the line
+normalisers = {
+    "exact": lambda line: line.rstrip("\n"),
+    "whitespace": lambda line: " ".join(line.split()),
+    "tokens": lambda line: " ".join(basic_tokenizer(line)),
+}
+
+
+# a 64 bit hash of a normalised line, much smaller than the line itself
+def lineHash(line):
+    return struct.unpack("<q", hashlib.sha1(line).digest()[:8])[0]
+
+
+class OverlapIndex(object):
+    """ Hashes of the lines of a training set, read from the files prefix.code
+    and prefix.en. For every mode in modes and every kind ("code", "en" and
+    "pair" when both files are indexed) a set of the hashes is kept. """
+
+    def __init__(self, prefix, modes=["exact"], kinds=["code", "en"]):
+        self.modes = modes
+        self.kinds = list(kinds)
+        if "code" in kinds and "en" in kinds:
+            self.kinds.append("pair")
+
+        self.index = dict(((mode, kind), set()) for mode in modes for kind in self.kinds)
+        for lines in iterLines(prefix, kinds):
+            for (mode, kind, key) in self.keys(lines):
+                self.index[(mode, kind)].add(key)
+
+    # the (mode, kind, hash) keys of a line of each kind
+    def keys(self, lines):
+        for mode in self.modes:
+            normalised = dict((kind, normalisers[mode](line)) for (kind, line) in lines.items())
+            for (kind, line) in normalised.items():
+                yield (mode, kind, lineHash(line))
+
+            if "pair" in self.kinds:
+                yield (mode, "pair", lineHash(normalised["code"] + "\0" + normalised["en"]))
+
+    # check if the line of the given kind is in the training set
+    def contains(self, kind, line, mode="exact"):
+        return lineHash(normalisers[mode](line)) in self.index[(mode, kind)]
+
+    # count the lines of a dev set which are in the training set, for each mode
+    # and kind, in a single pass over the dev files
+    def overlap(self, prefix):
+        counts = dict((key, 0) for key in self.index)
+        lines = 0
+        for devLines in iterLines(prefix, [kind for kind in self.kinds if kind != "pair"]):
+            lines += 1
+            for key in self.keys(devLines):
+                if key[2] in self.index[key[:2]]:
+                    counts[key[:2]] += 1
+
+        return (counts, lines)
+
+
+# yield the lines of the files of a data set as a {kind: line} dict
+def iterLines(prefix, kinds):
+    files = [open(prefix + extensions[kind]) for kind in kinds]
+    try:
+        for lines in itertools.izip(*files):
+            yield dict(zip(kinds, lines))
+    finally:
+        for f in files:
+            f.close()